@@ -1,390 +1,554 @@
+from collections import namedtuple
+import getpass
+import hashlib
+import os
+import tempfile
+import threading
+import time
+
 import dash
-from dash import Input, Output, dcc, html
-import pandas as pd
+from dash import ClientsideFunction, Input, Output, dcc, html
+import plotly.colors
 import plotly.graph_objects as go
-import plotly.express as px
-import geopandas
-
-# Data imports
-evcp_data_directory = r'C:\Users\Win 10 user\OneDrive\EV Dashboard\Source Data\Charge Points'
-ev_registrations_directory = r'C:\Users\Win 10 user\OneDrive\EV Dashboard\Source Data\EV Registrations'
-geo_data_uk_districts = r'C:\Users\Win 10 user\OneDrive\EV Dashboard\Source Data\GeoJSON UK Districts\Local_Authority_Districts_(December_2020)_UK_BFC_v1.2.geojson'
-
-# EVCP data
-df_evcp_total = pd.read_csv(evcp_data_directory + '\\' + 'charge_points_devices_total.csv')
-df_evcp_rapid = pd.read_csv(evcp_data_directory + '\\' + 'charge_points_devices_rapid.csv')
-df_evcp_total_pop = pd.read_csv(evcp_data_directory + '\\' + 'charge_points_per_100k_total.csv')
-df_evcp_rapid_pop = pd.read_csv(evcp_data_directory + '\\' + 'charge_points_per_100k_rapid.csv')
-
-# EV data
-df_ulev_total = pd.read_csv(ev_registrations_directory + '\\' + 'ev_registrations_ulev.csv')
-df_phev_total = pd.read_csv(ev_registrations_directory + '\\' + 'ev_registrations_phev.csv')
-df_bev_total = pd.read_csv(ev_registrations_directory + '\\' + 'ev_registrations_bev.csv')
-
-# Geo JSON data - UK Districts
-uk_districts = geopandas.read_file(geo_data_uk_districts)
-uk_districts.to_crs(epsg=4326, inplace=True)
+from EVCallbackCache import CallbackCache
+from EVColumnarStore import ColumnarTable, load_table
+from EVDataReloader import DataReloader
+from EVDataStore import EVDataStore
+from EVDerivedMetrics import RatioMetric, TimeAlignment, derive_metrics
+from EVFigureCache import FigureCache
+from EVFigureEncoding import dashboard_template, encode_figure, typed_arrays_supported
+from EVMetrics import CallbackMetrics
+from EVGeoData import BoundaryAsset, DeferredBoundaryAsset, build_boundary_levels, file_token, level_for_zoom
+from EVProjection import ProjectionEngine
+from EVSqliteStore import SqlDataStore, metric_revisions
+
+# Version of what the callbacks return, part of the callback cache key along with the config and the data version.
+# Bump it with any change to the figures, chart stores or stamps, so results cached by the previous code are not served.
+callback_cache_version = 1
+
+# Default configuration, any of which can be overridden by the config passed to create_app
+default_config = {
+    # Data imports
+    'evcp_data_directory': r'C:\Users\Win 10 user\OneDrive\EV Dashboard\Source Data\Charge Points',
+    'ev_registrations_directory': r'C:\Users\Win 10 user\OneDrive\EV Dashboard\Source Data\EV Registrations',
+    'geo_data_uk_districts': r'C:\Users\Win 10 user\OneDrive\EV Dashboard\Source Data\GeoJSON UK Districts\Local_Authority_Districts_(December_2020)_UK_BFC_v1.2.geojson',
+    'geo_data_cache_directory': r'C:\Users\Win 10 user\OneDrive\EV Dashboard\Source Data\GeoJSON UK Districts\Simplified',
+    # 'memory' holds every metric in NumPy arrays, 'sqlite' queries the database the extractors write to. Only the
+    # base metrics are queried, the derived metrics and projections are held in NumPy arrays with either backend.
+    'data_backend': 'memory',
+    'database_path': r'C:\Users\Win 10 user\OneDrive\EV Dashboard\Source Data\ev_dashboard.sqlite',
+    # Seconds between checks for new extractor output, which is loaded and swapped in without a restart. None
+    # loads the data once at start up.
+    'data_reload_interval': 60,
+    'map_zoom': 5,
+    # Boundary level to draw ('full', 'high', 'medium' or 'low'), None picks it from map_zoom
+    'map_boundary_level': None,
+    # Map figure cache - figures are keyed on (data version, map option, date) and evicted least recently used first
+    'map_cache_max_bytes': 512 * 1024 * 1024,
+    # Prebuild the latest period of every map once the map data is loaded
+    'map_cache_warm_up': False,
+    # When the boundaries are prepared and the map warm-up runs: 'eager' before the server starts, 'background' on
+    # a thread so the server answers straight away, or 'lazy' on the first map request (skipping the warm-up)
+    'map_data_loading': 'background',
+    # gzip / brotli compress responses, needs flask-compress
+    'compress_responses': True,
+    # Send numeric figure arrays as base64 typed arrays, None uses them when the installed Dash supports them
+    'figure_typed_arrays': None,
+    # Print how long start up took
+    'report_startup_time': True,
+    # Per callback latency by stage, response sizes, cache hit counts and start up timings, served in the Prometheus
+    # text format at metrics_path. metrics_log also writes each callback request to the 'ev_dashboard.metrics' logger,
+    # to stderr unless logging is configured for it.
+    'metrics': False,
+    'metrics_log': False,
+    'metrics_path': '/metrics',
+    # Trend projections: each region's trend is fitted over its last projection_fit_periods periods and projected
+    # projection_horizon periods ahead
+    'projection_fit_periods': 8,
+    'projection_horizon': 8,
+    # Derived metrics pair each charging device snapshot with the registrations counted at most this many months before
+    'derived_metric_max_lag_months': 2,
+    # Callback result cache shared by every worker process - set the directory under /dev/shm to hold it in shared
+    # memory, or to None to turn it off. Results are keyed on the data version, the config and callback_cache_version
+    # so neither new data, a config change nor a new release of the app is served stale results.
+    # The directory must be private to the user running the app, see CallbackCache. 'default' is a directory per
+    # user under the system temp directory, see default_callback_cache_directory.
+    'callback_cache_directory': 'default',
+    'callback_cache_ttl': 3600,
+    'callback_cache_max_bytes': 256 * 1024 * 1024
+}
 
 # Generate dropdown lists
-location_options_list = [{'label' : name, 'value': name} for name in df_ulev_total['LA/RegionName'].unique()]
-evcp_dates_options_list = [{'label' : name, 'value': name} for name in df_evcp_total['Date'].unique()]
-ev_dates_options_list = [{'label' : name, 'value': name} for name in df_ulev_total['Date'].unique()]
 map_options_list = [{'label': 'Map 1: Total ULEVs', 'value': 'Map1'},
                     {'label': 'Map 2: Total PHEVs', 'value': 'Map2'},
                     {'label': 'Map 3: Total BEVs', 'value': 'Map3'},
                     {'label': 'Map 4: Total EVCPs', 'value': 'Map4'},
                     {'label': 'Map 5: Rapid EVCPs', 'value': 'Map5'},
                     {'label': 'Map 6: Total Per100K EVCPS', 'value': 'Map6'},
-                    {'label': 'Map 7: Rapid Per100K EVCPS', 'value': 'Map7'}]
+                    {'label': 'Map 7: Rapid Per100K EVCPS', 'value': 'Map7'},
+                    {'label': 'Map 8: Projected ULEVs', 'value': 'Map8'},
+                    {'label': 'Map 9: Projected EVCPs', 'value': 'Map9'},
+                    {'label': 'Map 10: ULEVs per EVCP', 'value': 'Map10'},
+                    {'label': 'Map 11: BEVs per Rapid EVCP', 'value': 'Map11'}]
 ev_options_list = [{'label': 'EV Chart 1: ULEV', 'value': 'ULEV'},
                    {'label': 'EV Chart 2: PHEV', 'value': 'PHEV'},
                    {'label': 'EV Chart 3: BEV', 'value': 'BEV'}]
 evcp_options_list = [{'label': 'EVCP Chart 1: Total Devices', 'value': 'total'},
-                     {'label': 'EVCP Chart 2: Rapid Devices', 'value': 'rapid'}]
-
-# Get date marks - evcp
-marks = {i: label for i, label in zip(range(9), list(df_evcp_total['Date'].unique())[::-1])}
-
-# Get date marks - ev
-marks_ev = {i : label for i, label in zip(range(len(df_ulev_total['Date'].unique())), list(df_ulev_total['Date'].unique())[::-1])}
-
-# Helper functions
-def date_lookup_func(x):
-    for v ,i in marks.items():
-        if i == x:
-            return int(v)
-
-def date_lookup_func_ev(x):
-    for v ,i in marks_ev.items():
-        if i == x:
-            return int(v)
-
-# Initialise app
-app = dash.Dash(__name__)
-
-# Set app layout
-app.layout = (html.Div(className='grid-container', children=[
-    html.Div(className='header-container', children=[
-        html.H1(className='dashboard-title',children='Electric Vehicle Registrations and Charge Points in the UK'),
-        html.Div(className='stamp', children=[
-            html.Div(className='stamp-title', children='ULEV Registrations Change - Total', id='ev-total-stamp-title'),
-            html.Div(id='ev-total-change-container', className='stamp-content-container'),
-            html.Div(id='ev-total-change-container-information', className='stamp-information')
-        ]),
-        html.Div(className='stamp', children=[
-            html.Div(className='stamp-title', children='ULEV Registrations Change - %', id='ev-percent-stamp-title'),
-            html.Div(id='ev-percent-change-container', className='stamp-content-container'),
-            html.Div(id='ev-percent-change-container-information', className='stamp-information')
-        ]),
-        html.Div(className='stamp', children=[
-            html.Div(className='stamp-title', children='EV Charge Points Change - Total', id='evcp-total-stamp-title'),
-            html.Div(id='evcp-total-change-container', className='stamp-content-container'),
-            html.Div(id='evcp-total-change-container-information', className='stamp-information')
-        ]),
-        html.Div(className='stamp', children=[
-            html.Div(className='stamp-title', children='EV Charge Points Change - %', id='evcp-percent-stamp-title'),
-            html.Div(id='evcp-percent-change-container', className='stamp-content-container'),
-            html.Div(id='evcp-percent-change-container-information', className='stamp-information')
-        ])
-    ]),
-    html.Div(className='info-filters-container', children=[
-        html.H2(className='dropdown-title', children='Chart Controls'),
-        dcc.Dropdown(id='ev-chart-selection-dropdown', value='ULEV', options=ev_options_list),
-        dcc.Dropdown(id='evcp-chart-selection-dropdown', value='total', options=evcp_options_list),
-        dcc.Dropdown(options=location_options_list, id='location-dropdown', value=['Great Britain'], multi=True),
-        html.H2(className='dropdown-title', children='Map Controls'),
-        dcc.Dropdown(id='map-chart-select-dropdown', options=map_options_list, value='Map1', style={'display': 'grid'}),
-        dcc.Dropdown(id='map-dropdown-ev', options=ev_dates_options_list, value='2021 Q3', style={'display': 'grid'}),
-        dcc.Dropdown(id='map-dropdown-evcp', options=evcp_dates_options_list, value='Jan-22', style={'display': 'none'})
-    ]),
-    html.Div(className='map-1-container', children=[
-        dcc.Graph(id='map', style={'margin': 2, 'fontFamily': 'Sans Serif', 'fontSize': 'large'})
-    ]),
-    html.Div(className='line-chart-ev-container', children=[
-        dcc.Graph(id='ev-chart', style={'margin': 5, 'fontFamily': 'sans serif', 'fontSize': 'large'}),
-        dcc.RangeSlider(id='ev-date-slider',min=0, max=39, step=1, marks=marks_ev, value=[0, 39])
-    ]),
-    html.Div(className='line-chart-evcp-container', children=[
-        dcc.Graph(id='evcp-chart', style={'margin': 2, 'marginBottom': 0, 'fontFamily': 'sans serif', 'fontSize': 'large'}),
-        dcc.RangeSlider(id='evcp-date-slider',min=0, max=8, step=1, marks=marks, value=[0, 8])
-    ])
-]))
-
-# Set callback functions
-
-@app.callback(Output('ev-chart', 'figure'),
-              [Input('location-dropdown', 'value'), Input('ev-date-slider', 'value'), Input('ev-chart-selection-dropdown', 'value')])
-def update_ev_chart(location, date, ev_chart_selection):
-    def set_dataframe(dataframe):
-        df = dataframe.copy()
-        df['DateLookUp'] = df['Date'].apply(date_lookup_func_ev)
-        df = df.loc[df['DateLookUp'].between(date[0], date[1])]
-        return df
-
-    def set_charts(dataframe, x_axis_value, title):
-        traces = [go.Scatter(x=dataframe.loc[dataframe['LA/RegionName'] == loc]['Date'],
-                             y=dataframe.loc[dataframe['LA/RegionName'] == loc][x_axis_value], name=loc, line={'width': 5}) for
-                  loc in location]
-
-        layout = go.Layout(hovermode='x', font={'family': 'sans-serif', 'size': 15}, xaxis={'showgrid': False},
-                           yaxis={'showgrid': True, 'gridcolor': '#eeeeee'}, plot_bgcolor='white',
-                           title=f'<b>{title}</b>')
-        fig = go.Figure(data=traces, layout=layout)
-        fig['layout']['xaxis']['autorange'] = "reversed"
-
-        return fig
-
-    if ev_chart_selection == 'ULEV':
-        df_ev = set_dataframe(df_ulev_total)
-        fig = set_charts(df_ev, 'ULEVRegistrations', 'ULEV Registrations by Location, Quarter and Year')
-        return fig
-
-    if ev_chart_selection == 'PHEV':
-        df_ev = set_dataframe(df_phev_total)
-        fig = set_charts(df_ev, 'PHEVRegistrations', 'PHEV Registrations by Location, Quarter and Year')
-        return fig
-
-    if ev_chart_selection == 'BEV':
-        df_ev = set_dataframe(df_bev_total)
-        fig = set_charts(df_ev, 'BEVRegistrations', 'BEV Registrations by Location, Quarter and Year')
-        return fig
-
-
-
-
-@app.callback(Output('evcp-chart', 'figure'),
-              [Input('location-dropdown', 'value'), Input('evcp-date-slider', 'value'), Input('evcp-chart-selection-dropdown', 'value')])
-def updated_evcp_chart(location, date, evcp_chart_selection):
-    def set_dataframe(dataframe):
-
-        df = dataframe.copy()
-        df['DateLookUp'] = df['Date'].apply(date_lookup_func)
-        df = df.loc[df['DateLookUp'].between(date[0], date[1])]
-
-        return df
-
-    def set_charts(dataframe, x_axis_value, title):
-        traces = [go.Scatter(x=dataframe.loc[dataframe['LA/RegionName'] == loc]['Date'],
-                             y=dataframe.loc[dataframe['LA/RegionName'] == loc][x_axis_value], name=loc, line={'width': 5}) for loc in location]
-
-        layout = go.Layout(hovermode='x', font={'family':'sans-serif', 'size': 15}, xaxis={'showgrid': False},
-                           yaxis={'showgrid': True, 'gridcolor': '#eeeeee'}, plot_bgcolor='white',
-                           title=f'<b>{title}</b>')
-        fig = go.Figure(data=traces, layout=layout)
-        fig['layout']['xaxis']['autorange'] = "reversed"
-
-        return fig
-
-    if evcp_chart_selection == 'total':
-        df = set_dataframe(df_evcp_total)
-        fig = set_charts(df, 'TotalDevices', 'Total Electric Vehicle Charge Points by Location, Month and Year')
-        return fig
-
-    if evcp_chart_selection == 'rapid':
-        df = set_dataframe(df_evcp_rapid)
-        fig = set_charts(df, 'RapidDevices', 'Rapid Electric Vehicle Charge Points by Location, Month and Year')
-        return fig
-
-@app.callback([Output('map', 'figure'), Output('map-dropdown-ev', 'style'), Output('map-dropdown-evcp', 'style')],
-              [Input('map-dropdown-ev', 'value'), Input('map-dropdown-evcp', 'value'),
-               Input('map-chart-select-dropdown', 'value')])
-def update_map(ev_date, evcp_date, map_option):
-
-    def set_df(dataframe, date, continuous_data_column_name):
-        df = dataframe.copy()
-        df = df.loc[df['Date'] == date][['LA/RegionCode', continuous_data_column_name]]
-        gdf_joined = pd.merge(left=uk_districts, right=df, left_on='LAD20CD', right_on='LA/RegionCode', how='left')
-        gdf_joined.set_index('OBJECTID', inplace=True)
-        gdf_joined.dropna(inplace=True)
-        return gdf_joined
-
-    def set_map(dataframe, color_scale, hover_data, title):
-        fig = px.choropleth_mapbox(dataframe,
-                                   geojson=dataframe.geometry,
-                                   locations=dataframe.index,
-                                   color=color_scale,
-                                   color_continuous_scale=px.colors.sequential.Rainbow,
-                                   mapbox_style='open-street-map',
-                                   center={'lat': 55.3781, 'lon': -3.4360}, zoom=5,
-                                   hover_data=hover_data,
-                                   title=f'<b>{title}</b>')
-
-        fig.update_geos(fitbounds="geojson")
-        fig.update_layout(font={'size': 16, 'family': 'sans-serif'}, coloraxis_colorbar={'title': None})
-
-        return fig
-
-    if map_option == 'Map1':
-        gdf_joined = set_df(df_ulev_total, ev_date, 'ULEVRegistrations')
-
-        fig = set_map(gdf_joined, 'ULEVRegistrations', [gdf_joined['LAD20NM'],
-                      gdf_joined['ULEVRegistrations']], 'Total ULEV Registrations by LAD, Quarter and Year')
-        return fig, {'display': 'grid'}, {'display': 'none'}
-
-    if map_option == 'Map2':
-        gdf_joined = set_df(df_phev_total, ev_date, 'PHEVRegistrations')
-
-        fig = set_map(gdf_joined, 'PHEVRegistrations', [gdf_joined['LAD20NM'], gdf_joined['PHEVRegistrations']],
-                      'Total PHEV Registrations by LAD, Quarter and Year')
-        return fig, {'display': 'grid'}, {'display': 'none'}
-
-    if map_option == 'Map3':
-        gdf_joined = set_df(df_bev_total, ev_date, 'BEVRegistrations')
-
-        fig = set_map(gdf_joined, 'BEVRegistrations', [gdf_joined['LAD20NM'], gdf_joined['BEVRegistrations']],
-                      'Total BEV Registrations by LAD, Quarter and Year')
-        return fig, {'display': 'grid'}, {'display': 'none'}
-
-    if map_option == 'Map4':
-        gdf_joined = set_df(df_evcp_total, evcp_date, 'TotalDevices')
-
-        fig = set_map(gdf_joined, 'TotalDevices', [gdf_joined['LAD20NM'], gdf_joined['TotalDevices']],
-                      'Total EV Charge Points by LAD, Month and Year')
-        return fig, {'display': 'none'}, {'display': 'grid'}
-
-    if map_option == 'Map5':
-        gdf_joined = set_df(df_evcp_rapid, evcp_date, 'RapidDevices')
-
-        fig = set_map(gdf_joined, 'RapidDevices', [gdf_joined['LAD20NM'], gdf_joined['RapidDevices']],
-                      'Rapid EV Charge Points by LAD, Month and Year')
-        return fig, {'display': 'none'}, {'display': 'grid'}
-
-    if map_option == 'Map6':
-        gdf_joined = set_df(df_evcp_total_pop, evcp_date, 'Per100kPop')
-
-        fig = set_map(gdf_joined, 'Per100kPop', [gdf_joined['LAD20NM'], gdf_joined['Per100kPop']],
-                      'Total EV Charge Points per 100k Population by LAD, Month and Year')
-        return fig, {'display': 'none'}, {'display': 'grid'}
-
-    if map_option == 'Map7':
-        gdf_joined = set_df(df_evcp_rapid_pop, evcp_date, 'Per100kPop')
-
-        fig = set_map(gdf_joined, 'Per100kPop', [gdf_joined['LAD20NM'], gdf_joined['Per100kPop']],
-                      'Rapid EV Charge Points per 100k Population by LAD, Month and Year')
-        return fig, {'display': 'none'}, {'display': 'grid'}
-
-@app.callback([Output('ev-total-change-container', 'children'), Output('ev-percent-change-container', 'children'),
-               Output('ev-total-change-container-information', 'children'), Output('ev-percent-change-container-information', 'children'),
-               Output('ev-total-stamp-title', 'children'), Output('ev-percent-stamp-title', 'children')],
-              [Input('location-dropdown', 'value'), Input('ev-date-slider', 'value'), Input('ev-chart-selection-dropdown', 'value')])
-def update_stamps_ev(location, ev_time_period, ev_chart_selection):
-
-    def set_ev_stamp(dataframe, x_axis_value):
-        df_ev = dataframe.copy()
-        df_ev['DateLookUp'] = df_ev['Date'].apply(date_lookup_func_ev)
-
-        end_value_ev = df_ev.loc[(df_ev['LA/RegionName'] == location[0]) & (df_ev['DateLookUp'] == ev_time_period[0])][
-            x_axis_value].iloc[0]
-
-        end_date_ev = \
-        df_ev.loc[(df_ev['LA/RegionName'] == location[0]) & (df_ev['DateLookUp'] == ev_time_period[0])]['Date'].iloc[0]
-
-        start_value_ev = \
-        df_ev.loc[(df_ev['LA/RegionName'] == location[0]) & (df_ev['DateLookUp'] == ev_time_period[1])][
-            x_axis_value].iloc[0]
-
-        start_date_ev = df_ev.loc[(df_ev['LA/RegionName'] == location[0]) & (df_ev['DateLookUp'] == ev_time_period[1])][
-            'Date'].iloc[0]
-
-        if start_value_ev < 1:
-            start_value_ev = 1
-
-        total_ev_string = f'{start_value_ev - end_value_ev}'
-        percent_ev_string = f'{int(round(((start_value_ev - end_value_ev) / end_value_ev) * 100, 0))}%'
-
-        ev_information_string = f'{end_date_ev} - {start_date_ev} {location[0]}'
-
-        return total_ev_string, percent_ev_string, ev_information_string, \
-               ev_information_string
-
-    if ev_chart_selection == 'ULEV':
-        if len(location) < 1:
-            return '-', '-', '-', '-', '-', '-'
-        total_ev_string, percent_ev_string, ev_information_string, \
-               ev_information_string = set_ev_stamp(df_ulev_total, 'ULEVRegistrations')
-
-        stamp_title_total = 'ULEV Registrations Change - Total'
-        stamp_title_percent = 'ULEV Registrations Change - %'
-        return total_ev_string, percent_ev_string, ev_information_string, \
-               ev_information_string, stamp_title_total, stamp_title_percent
-
-    if ev_chart_selection == 'PHEV':
+                     {'label': 'EVCP Chart 2: Rapid Devices', 'value': 'rapid'},
+                     {'label': 'EVCP Chart 3: ULEVs per Device', 'value': 'ulev_per_device'},
+                     {'label': 'EVCP Chart 4: BEVs per Rapid Device', 'value': 'bev_per_rapid'}]
+
+# Map options: metric, value column, date dropdown timeline and title
+map_definitions = {'Map1': ('ULEVRegistrations', 'ULEVRegistrations', 'ev', 'Total ULEV Registrations by LAD, Quarter and Year'),
+                   'Map2': ('PHEVRegistrations', 'PHEVRegistrations', 'ev', 'Total PHEV Registrations by LAD, Quarter and Year'),
+                   'Map3': ('BEVRegistrations', 'BEVRegistrations', 'ev', 'Total BEV Registrations by LAD, Quarter and Year'),
+                   'Map4': ('TotalDevices', 'TotalDevices', 'evcp', 'Total EV Charge Points by LAD, Month and Year'),
+                   'Map5': ('RapidDevices', 'RapidDevices', 'evcp', 'Rapid EV Charge Points by LAD, Month and Year'),
+                   'Map6': ('TotalPer100kPop', 'Per100kPop', 'evcp',
+                            'Total EV Charge Points per 100k Population by LAD, Month and Year'),
+                   'Map7': ('RapidPer100kPop', 'Per100kPop', 'evcp',
+                            'Rapid EV Charge Points per 100k Population by LAD, Month and Year'),
+                   'Map10': ('ULEVsPerDevice', 'ULEVsPerDevice', 'evcp', 'ULEVs per EV Charge Point by LAD'),
+                   'Map11': ('BEVsPerRapidDevice', 'BEVsPerRapidDevice', 'evcp', 'BEVs per Rapid EV Charge Point by LAD')}
+
+# Projected map options: metric, value column and title, shown at the end of the projection horizon
+projection_map_definitions = {'Map8': ('ULEVRegistrations', 'ULEVRegistrations', 'Projected ULEV Registrations by LAD'),
+                              'Map9': ('TotalDevices', 'TotalDevices', 'Projected EV Charge Points by LAD')}
+
+# Metrics: directory setting and extractor output file, value column and the timeline their date slider uses
+metric_sources = {'ULEVRegistrations': ('ev_registrations_directory', 'ev_registrations_ulev.csv', 'ULEVRegistrations', 'ev'),
+                  'PHEVRegistrations': ('ev_registrations_directory', 'ev_registrations_phev.csv', 'PHEVRegistrations', 'ev'),
+                  'BEVRegistrations': ('ev_registrations_directory', 'ev_registrations_bev.csv', 'BEVRegistrations', 'ev'),
+                  'TotalDevices': ('evcp_data_directory', 'charge_points_devices_total.csv', 'TotalDevices', 'evcp'),
+                  'RapidDevices': ('evcp_data_directory', 'charge_points_devices_rapid.csv', 'RapidDevices', 'evcp'),
+                  'TotalPer100kPop': ('evcp_data_directory', 'charge_points_per_100k_total.csv', 'Per100kPop', 'evcp'),
+                  'RapidPer100kPop': ('evcp_data_directory', 'charge_points_per_100k_rapid.csv', 'Per100kPop', 'evcp')}
+
+# Derived metrics, computed at load time from the metrics above on the denominator's timeline
+derived_metric_definitions = {'ULEVsPerDevice': RatioMetric('ULEVRegistrations', 'TotalDevices', 'ULEVsPerDevice'),
+                              'BEVsPerRapidDevice': RatioMetric('BEVRegistrations', 'RapidDevices', 'BEVsPerRapidDevice')}
+
+# Shared chart layouts on the slim dashboard template, figures only add their title
+line_chart_layout = go.Layout(template=dashboard_template, hovermode='x', font={'family': 'sans-serif', 'size': 15},
+                              xaxis={'showgrid': False}, yaxis={'showgrid': True, 'gridcolor': '#eeeeee'},
+                              plot_bgcolor='white')
+map_layout = go.Layout(template=dashboard_template,
+                       mapbox={'style': 'open-street-map', 'center': {'lat': 55.3781, 'lon': -3.4360}},
+                       coloraxis={'colorscale': plotly.colors.sequential.Rainbow, 'colorbar': {'title': None}},
+                       margin={'t': 60}, font={'size': 16, 'family': 'sans-serif'})
+
+# Line chart options: metric and title
+chart_definitions = {'ULEV': ('ULEVRegistrations', 'ULEV Registrations by Location, Quarter and Year'),
+                     'PHEV': ('PHEVRegistrations', 'PHEV Registrations by Location, Quarter and Year'),
+                     'BEV': ('BEVRegistrations', 'BEV Registrations by Location, Quarter and Year'),
+                     'total': ('TotalDevices', 'Total Electric Vehicle Charge Points by Location, Month and Year'),
+                     'rapid': ('RapidDevices', 'Rapid Electric Vehicle Charge Points by Location, Month and Year'),
+                     'ulev_per_device': ('ULEVsPerDevice', 'ULEVs per Charge Point by Location, Month and Year'),
+                     'bev_per_rapid': ('BEVsPerRapidDevice', 'BEVs per Rapid Charge Point by Location, Month and Year')}
+
+# Stamp options: metric and title
+stamp_definitions = {'ULEV': ('ULEVRegistrations', 'ULEV Registrations Change'),
+                     'PHEV': ('PHEVRegistrations', 'PHEV Registrations Change'),
+                     'BEV': ('BEVRegistrations', 'BEV Registrations Change'),
+                     'total': ('TotalDevices', 'Total Charge Points Change'),
+                     'rapid': ('RapidDevices', 'Rapid Charge Points Change'),
+                     'ulev_per_device': ('ULEVsPerDevice', 'ULEVs per Charge Point Change'),
+                     'bev_per_rapid': ('BEVsPerRapidDevice', 'BEVs per Rapid Charge Point Change')}
+
+def load_data(config):
+    '''
+    Loads every metric into a dense (region x period) store, the single source of period ordering for the sliders.
+    The source tables are only needed while the store is built, so what stays in memory is the shared region table
+    and the NumPy metric cubes, see benchmarks/bench_memory.py.
+    With data_backend 'sqlite' the metrics are instead queried from the extractors' SQLite database on demand. The
+    derived metrics and projections built from them in create_app are held in memory either way.
+    '''
+    if config['data_backend'] == 'sqlite':
+        return SqlDataStore(config['database_path'], {
+            metric_name: (os.path.splitext(file_name)[0], value_column, timeline_name)
+            for metric_name, (_, file_name, value_column, timeline_name) in metric_sources.items()})
+
+    return EVDataStore.from_tables({
+        metric_name: (load_table(config[directory], file_name, value_column), value_column, timeline_name)
+        for metric_name, (directory, file_name, value_column, timeline_name) in metric_sources.items()})
+
+def source_fingerprint(config):
+    '''
+    Returns a cheap token of the extractor output load_data reads - the size and modification time of every csv and
+    columnar manifest, or the metric revisions in the SQLite database - so new output is spotted without loading it.
+    '''
+    if config['data_backend'] == 'sqlite':
+        return metric_revisions(config['database_path'])
+
+    tokens = []
+    for directory, file_name, _, _ in metric_sources.values():
+        columnar_path = os.path.join(config[directory], os.path.splitext(file_name)[0] + ColumnarTable.suffix)
+        for path in (os.path.join(config[directory], file_name), os.path.join(columnar_path, 'manifest.json')):
+            tokens.append(file_token(path) if os.path.exists(path) else None)
+    return tokens
+
+# The data the callbacks answer from, replaced as a whole when new extractor output is loaded
+DataSnapshot = namedtuple('DataSnapshot', ['data_store', 'derived', 'ev_timeline', 'evcp_timeline', 'projections',
+                                           'version'])
+
+def load_boundaries(config):
+    '''
+    Geo JSON data - UK Districts, simplified once per source file and cached on disk. Returns the compact boundary
+    asset sent to the browser once, so map figures only carry values.
+    '''
+    boundary_level_paths = build_boundary_levels(config['geo_data_uk_districts'], config['geo_data_cache_directory'])
+    return BoundaryAsset.from_file(boundary_level_paths[config['map_boundary_level'] or level_for_zoom(config['map_zoom'])])
+
+def default_callback_cache_directory():
+    '''
+    Returns a callback cache directory private to the current user under the system temp directory. Containers run
+    under an arbitrary uid often have no user name, so the uid is used when the name cannot be looked up.
+    '''
+    try:
+        user = getpass.getuser()
+    except (KeyError, ImportError, OSError):
+        user = str(os.getuid())
+    return os.path.join(tempfile.gettempdir(), f'ev_dashboard_callbacks_{user}')
+
+def create_app(config: dict = None):
+    '''
+    Builds the dashboard from config, overriding default_config. All data is loaded here, so creating the app in a
+    gunicorn master started with --preload (see wsgi.py) loads it once before the workers fork, and the NumPy
+    buffers holding it stay shared copy-on-write between them.
+
+    With data_reload_interval set, each process watches the extractor output and swaps in a new DataSnapshot when it
+    changes, see DataReloader. Every callback reads the snapshot once, and cached results are keyed on its version.
+    '''
+    config = {**default_config, **(config or {})}
+    if config['callback_cache_directory'] == 'default':
+        config['callback_cache_directory'] = default_callback_cache_directory()
+    map_zoom = config['map_zoom']
+    start = time.perf_counter()
+
+    # Map data is prepared according to map_data_loading, map callbacks wait for it with boundaries.load()
+    boundaries = DeferredBoundaryAsset(lambda: load_boundaries(config))
+
+    def load_snapshot():
+        data_store = load_data(config)
+        alignment = TimeAlignment(data_store.timelines, config['derived_metric_max_lag_months'])
+        derived = derive_metrics(data_store, derived_metric_definitions, alignment)
+        projections = ProjectionEngine(data_store, config['projection_fit_periods'], config['projection_horizon'])
+        return DataSnapshot(data_store, derived, data_store.timelines['ev'], data_store.timelines['evcp'], projections,
+                            data_store.version)
+
+    def metric_store(snapshot, metric_name):
+        return snapshot.derived if metric_name in snapshot.derived.metrics else snapshot.data_store
+
+    def data_memory_usage(snapshot):
+        usage = snapshot.data_store.memory_usage()
+        usage.update((f'derived {part}', size) for part, size in snapshot.derived.memory_usage().items())
+        return usage
+
+    figure_cache = FigureCache(config['map_cache_max_bytes'])
+    metrics = CallbackMetrics(config['metrics'], config['metrics_log'])
+    typed_arrays = config['figure_typed_arrays']
+    if typed_arrays is None:
+        typed_arrays = typed_arrays_supported()
+
+    # Helper functions
+    def build_map(snapshot, map_option, date):
+        boundary_asset = boundaries.load()
+
+        with metrics.stage('data'):
+            if map_option in projection_map_definitions:
+                metric_name, value_column, title = projection_map_definitions[map_option]
+                df = snapshot.projections.period_frame(metric_name)
+                title = f'{title}, {snapshot.projections.projection(metric_name).periods[-1]}'
+            else:
+                metric_name, value_column, _, title = map_definitions[map_option]
+                df = metric_store(snapshot, metric_name).period_frame(metric_name, date)
+                if metric_name in snapshot.derived.metrics:
+                    title = f'{title}, {date}'
+            df = df.loc[df['LA/RegionCode'].isin(boundary_asset.names.index)]
+            names = boundary_asset.names.reindex(df['LA/RegionCode']).to_numpy()
+
+        with metrics.stage('figure'):
+            trace = go.Choroplethmapbox(geojson=boundary_asset.url, featureidkey=boundary_asset.featureidkey,
+                                        locations=df['LA/RegionCode'].to_numpy(), z=df[value_column].to_numpy(),
+                                        text=names, coloraxis='coloraxis',
+                                        hovertemplate=f'LAD20NM=%{{text}}<br>{value_column}=%{{z}}<extra></extra>')
+
+            fig = go.Figure(data=[trace], layout=map_layout)
+            fig.update_layout(title=f'<b>{title}</b>', mapbox_zoom=map_zoom)
+
+            return encode_figure(fig, typed_arrays)
+
+    def map_date(snapshot, map_option, date):
+        # Derived metrics end at the last period both of their datasets cover, later dates show that period
+        metric_name = map_definitions[map_option][0]
+        if metric_name in snapshot.derived.metrics:
+            return snapshot.derived.latest_period(metric_name, date)
+        return date
+
+    def get_map(snapshot, map_option, date):
+        return figure_cache.get_or_build((snapshot.version, map_option, date),
+                                         lambda: build_map(snapshot, map_option, date))
+
+    def get_chart_store(snapshot, chart_selection):
+        metric_name, title = chart_definitions[chart_selection]
+
+        def build_chart_store():
+            with metrics.stage('data'):
+                store = metric_store(snapshot, metric_name).series_store(metric_name)
+            if metric_name in snapshot.data_store.metrics:
+                with metrics.stage('projection'):
+                    store['projection'] = snapshot.projections.series_store(metric_name)
+            with metrics.stage('figure'):
+                store['layout'] = go.Layout(line_chart_layout, title=f'<b>{title}</b>').to_plotly_json()
+            return store
+
+        return figure_cache.get_or_build((snapshot.version, chart_selection), build_chart_store)
+
+    def set_stamps(snapshot, metric_name, stamp_title, timeline, location, time_period):
+        # Summarises every selected location: the change is summed across locations with data at both ends of the
+        # slider and the percent is taken against their combined start value
         if len(location) < 1:
             return '-', '-', '-', '-', '-', '-'
-        total_ev_string, percent_ev_string, ev_information_string, \
-               ev_information_string = set_ev_stamp(df_phev_total, 'PHEVRegistrations')
-
-        stamp_title_total = 'PHEV Registrations Change - Total'
-        stamp_title_percent = 'PHEV Registrations Change - %'
-        return total_ev_string, percent_ev_string, ev_information_string, \
-               ev_information_string, stamp_title_total, stamp_title_percent
-
-    if ev_chart_selection == 'BEV':
-        if len(location) < 1:
-            return '-', '-', '-', '-', '-', '-'
-        total_ev_string, percent_ev_string, ev_information_string, \
-               ev_information_string = set_ev_stamp(df_bev_total, 'BEVRegistrations')
-
-        stamp_title_total = 'BEV Registrations Change - Total'
-        stamp_title_percent = 'BEV Registrations Change - %'
-        return total_ev_string, percent_ev_string, ev_information_string, \
-               ev_information_string, stamp_title_total, stamp_title_percent
-
-
-
 
-@app.callback([Output('evcp-total-change-container', 'children'), Output('evcp-percent-change-container', 'children'),
-               Output('evcp-total-change-container-information', 'children'),
-               Output('evcp-percent-change-container-information', 'children'), Output('evcp-total-stamp-title', 'children'),
-               Output('evcp-percent-stamp-title', 'children')],
-              [Input('location-dropdown', 'value'), Input('evcp-date-slider', 'value'), Input('evcp-chart-selection-dropdown', 'value')])
-def update_stamps_evcp(location, evcp_time_period, evcp_chart_selection):
-    def set_evcp_stamp(dataframe, x_axis_value):
-        df_evcp = dataframe.copy()
-
-        df_evcp['DateLookUp'] = df_evcp['Date'].apply(date_lookup_func)
-
-        end_value_evcp = \
-        df_evcp.loc[(df_evcp['LA/RegionName'] == location[0]) & (df_evcp['DateLookUp'] == evcp_time_period[0])][x_axis_value].iloc[0]
-
-        end_date_evcp = \
-        df_evcp.loc[(df_evcp['LA/RegionName'] == location[0]) & (df_evcp['DateLookUp'] == evcp_time_period[0])][
-            'Date'].iloc[0]
-
-        start_value_evcp = \
-        df_evcp.loc[(df_evcp['LA/RegionName'] == location[0]) & (df_evcp['DateLookUp'] == evcp_time_period[1])][
-            x_axis_value].iloc[0]
-
-        start_date_evcp = \
-        df_evcp.loc[(df_evcp['LA/RegionName'] == location[0]) & (df_evcp['DateLookUp'] == evcp_time_period[1])][
-
-            'Date'].iloc[0]
-
-        if start_value_evcp < 1:
-            start_value_evcp = 1
-
-        total_evcp_string = f'{start_value_evcp - end_value_evcp}'
-        percent_evcp_string = f'{int(round(((start_value_evcp - end_value_evcp) / end_value_evcp) * 100, 0))}%'
-        evcp_information_string = f'{end_date_evcp} - {start_date_evcp} {location[0]}'
-
-        return total_evcp_string, percent_evcp_string, evcp_information_string, evcp_information_string
+        if metric_name in snapshot.derived.metrics:
+            # As on the map, slider positions past the last period a derived metric covers use that period
+            periods = [snapshot.derived.latest_period(metric_name, timeline.periods[position]) for position in time_period]
+            time_period = [timeline.period_index[period] for period in periods]
+
+        with metrics.stage('data'):
+            stats = metric_store(snapshot, metric_name).change_statistics(metric_name, location, time_period[0],
+                                                                          time_period[1])
+            start_total = stats.start_values[stats.present].sum()
+            change_total = stats.change[stats.present].sum()
+
+        # Derived ratios are held to one decimal place, counts are whole numbers
+        total_string = (f'{change_total:.1f}' if stats.change.dtype.kind == 'f' else f'{change_total}') \
+            if stats.present.any() else '-'
+        percent_string = f'{int(round((change_total / start_total) * 100, 0))}%' if start_total else '-'
+        information_string = f'{timeline.periods[time_period[0]]} - {timeline.periods[time_period[1]]} {", ".join(location)}'
+
+        return total_string, percent_string, information_string, information_string, \
+               f'{stamp_title} - Total', f'{stamp_title} - %'
+
+    def warm_up_map_cache(snapshot):
+        for map_option, (metric_name, _, _, _) in map_definitions.items():
+            latest = metric_store(snapshot, metric_name).metrics[metric_name].timeline.latest
+            get_map(snapshot, map_option, map_date(snapshot, map_option, latest))
+        for map_option in projection_map_definitions:
+            get_map(snapshot, map_option, None)
+
+    def warm_up_snapshot(snapshot):
+        # Runs on the reloader thread before the swap, so the first requests for new data find the default charts
+        # and the latest maps already built
+        for chart_selection in chart_definitions:
+            get_chart_store(snapshot, chart_selection)
+        if boundaries.loaded:
+            warm_up_map_cache(snapshot)
+
+    def retire_snapshot(snapshot):
+        figure_cache.discard(lambda key: key[0] == snapshot.version)
+
+    reloader = DataReloader(load_snapshot, lambda: source_fingerprint(config), warm_up_snapshot, retire_snapshot,
+                            config['data_reload_interval'])
+    data_seconds = time.perf_counter() - start
+
+    callback_cache = None
+    if config['callback_cache_directory']:
+        # Cached results outlive the process, and settings such as projection_horizon change them as much as the data
+        config_version = hashlib.sha1(repr(sorted(config.items())).encode('utf-8')).hexdigest()[:16]
+        callback_cache = CallbackCache(config['callback_cache_directory'],
+                                       lambda: f'{callback_cache_version}-{config_version}-{reloader.current.version}',
+                                       config['callback_cache_ttl'], config['callback_cache_max_bytes'])
+
+    def memoize(callback):
+        return callback_cache.memoize(callback) if callback_cache else callback
+
+    def prepare_map_data():
+        boundaries.load()
+        if config['map_cache_warm_up']:
+            warm_up_map_cache(reloader.current)
+        if config['report_startup_time']:
+            print(f'Map data ready in {time.perf_counter() - start:.2f}s (boundaries {boundaries.load_seconds:.2f}s)')
+
+    # Initialise app
+    app = dash.Dash(__name__, compress=config['compress_responses'])
+    boundaries.register(app.server)
+
+    if config['map_data_loading'] == 'eager':
+        prepare_map_data()
+    elif config['map_data_loading'] == 'background':
+        threading.Thread(target=prepare_map_data, name='map-data-warm-up', daemon=True).start()
+
+    if config['data_reload_interval']:
+        # Started on the first request so each forked worker watches for new data itself
+        app.server.before_request(reloader.start)
+
+    def serve_layout():
+        # Evaluated per page load, so the dropdowns and sliders follow the data after a reload
+        snapshot = reloader.current
+        ev_timeline, evcp_timeline = snapshot.ev_timeline, snapshot.evcp_timeline
+
+        # Generate dropdown lists
+        location_options_list = [{'label' : name, 'value': name}
+                                 for name in snapshot.data_store.region_names('ULEVRegistrations')]
+        evcp_dates_options_list = [{'label' : name, 'value': name} for name in evcp_timeline.periods[::-1]]
+        ev_dates_options_list = [{'label' : name, 'value': name} for name in ev_timeline.periods[::-1]]
+
+        return html.Div(className='grid-container', children=[
+            html.Div(className='header-container', children=[
+                html.H1(className='dashboard-title',children='Electric Vehicle Registrations and Charge Points in the UK'),
+                html.Div(className='stamp', children=[
+                    html.Div(className='stamp-title', children='ULEV Registrations Change - Total', id='ev-total-stamp-title'),
+                    html.Div(id='ev-total-change-container', className='stamp-content-container'),
+                    html.Div(id='ev-total-change-container-information', className='stamp-information')
+                ]),
+                html.Div(className='stamp', children=[
+                    html.Div(className='stamp-title', children='ULEV Registrations Change - %', id='ev-percent-stamp-title'),
+                    html.Div(id='ev-percent-change-container', className='stamp-content-container'),
+                    html.Div(id='ev-percent-change-container-information', className='stamp-information')
+                ]),
+                html.Div(className='stamp', children=[
+                    html.Div(className='stamp-title', children='EV Charge Points Change - Total', id='evcp-total-stamp-title'),
+                    html.Div(id='evcp-total-change-container', className='stamp-content-container'),
+                    html.Div(id='evcp-total-change-container-information', className='stamp-information')
+                ]),
+                html.Div(className='stamp', children=[
+                    html.Div(className='stamp-title', children='EV Charge Points Change - %', id='evcp-percent-stamp-title'),
+                    html.Div(id='evcp-percent-change-container', className='stamp-content-container'),
+                    html.Div(id='evcp-percent-change-container-information', className='stamp-information')
+                ])
+            ]),
+            html.Div(className='info-filters-container', children=[
+                html.H2(className='dropdown-title', children='Chart Controls'),
+                dcc.Dropdown(id='ev-chart-selection-dropdown', value='ULEV', options=ev_options_list),
+                dcc.Dropdown(id='evcp-chart-selection-dropdown', value='total', options=evcp_options_list),
+                dcc.Dropdown(options=location_options_list, id='location-dropdown', value=['Great Britain'], multi=True),
+                dcc.Checklist(id='projection-toggle', options=[{'label': ' Show projected trend', 'value': 'show'}],
+                              value=[]),
+                html.H2(className='dropdown-title', children='Map Controls'),
+                dcc.Dropdown(id='map-chart-select-dropdown', options=map_options_list, value='Map1', style={'display': 'grid'}),
+                dcc.Dropdown(id='map-dropdown-ev', options=ev_dates_options_list, value=ev_timeline.latest, style={'display': 'grid'}),
+                dcc.Dropdown(id='map-dropdown-evcp', options=evcp_dates_options_list, value=evcp_timeline.latest, style={'display': 'none'})
+            ]),
+            html.Div(className='map-1-container', children=[
+                dcc.Graph(id='map', style={'margin': 2, 'fontFamily': 'Sans Serif', 'fontSize': 'large'})
+            ]),
+            html.Div(className='line-chart-ev-container', children=[
+                dcc.Graph(id='ev-chart', style={'margin': 5, 'fontFamily': 'sans serif', 'fontSize': 'large'}),
+                dcc.Store(id='ev-chart-store'),
+                dcc.RangeSlider(id='ev-date-slider',min=0, max=len(ev_timeline) - 1, step=1, marks=ev_timeline.marks,
+                                value=[0, len(ev_timeline) - 1])
+            ]),
+            html.Div(className='line-chart-evcp-container', children=[
+                dcc.Graph(id='evcp-chart', style={'margin': 2, 'marginBottom': 0, 'fontFamily': 'sans serif', 'fontSize': 'large'}),
+                dcc.Store(id='evcp-chart-store'),
+                dcc.RangeSlider(id='evcp-date-slider',min=0, max=len(evcp_timeline) - 1, step=1, marks=evcp_timeline.marks,
+                                value=[0, len(evcp_timeline) - 1])
+            ])
+        ])
 
-    if evcp_chart_selection == 'total':
-        if len(location) < 1:
-            return '-', '-', '-', '-', '-', '-'
-        total_evcp_string, percent_evcp_string, evcp_information_string, evcp_information_string = set_evcp_stamp(df_evcp_total, 'TotalDevices')
-        stamp_title_total = 'Total Charge Points Change - Total'
-        stamp_title_percent = 'Total Charge Points Change - %'
-        return total_evcp_string, percent_evcp_string, evcp_information_string, evcp_information_string, stamp_title_total, stamp_title_percent
+    app.layout = serve_layout
+
+    # Set callback functions
+
+    # The series of the selected metric are sent once per metric selection, the date sliders and location dropdown
+    # are then applied in the browser by assets/charts.js
+    @app.callback(Output('ev-chart-store', 'data'), [Input('ev-chart-selection-dropdown', 'value')])
+    @metrics.timed
+    @memoize
+    def update_ev_chart_store(ev_chart_selection):
+        return get_chart_store(reloader.current, ev_chart_selection)
+
+    @app.callback(Output('evcp-chart-store', 'data'), [Input('evcp-chart-selection-dropdown', 'value')])
+    @metrics.timed
+    @memoize
+    def update_evcp_chart_store(evcp_chart_selection):
+        return get_chart_store(reloader.current, evcp_chart_selection)
+
+    app.clientside_callback(ClientsideFunction(namespace='ev_charts', function_name='filter_series'),
+                            Output('ev-chart', 'figure'),
+                            [Input('ev-chart-store', 'data'), Input('location-dropdown', 'value'),
+                             Input('ev-date-slider', 'value'), Input('projection-toggle', 'value')])
+
+    app.clientside_callback(ClientsideFunction(namespace='ev_charts', function_name='filter_series'),
+                            Output('evcp-chart', 'figure'),
+                            [Input('evcp-chart-store', 'data'), Input('location-dropdown', 'value'),
+                             Input('evcp-date-slider', 'value'), Input('projection-toggle', 'value')])
+
+    @app.callback([Output('map', 'figure'), Output('map-dropdown-ev', 'style'), Output('map-dropdown-evcp', 'style')],
+                  [Input('map-dropdown-ev', 'value'), Input('map-dropdown-evcp', 'value'),
+                   Input('map-chart-select-dropdown', 'value')])
+    @metrics.timed
+    def update_map(ev_date, evcp_date, map_option):
+        # Figures refer to the boundaries by their content hashed url, which keys the shared cache on the boundaries
+        # served. It is only known once they are loaded, so the app starts without reading the boundary source.
+        return map_response(ev_date, evcp_date, map_option, boundaries.load().url)
+
+    @memoize
+    def map_response(ev_date, evcp_date, map_option, boundary_url):
+        snapshot = reloader.current
+        if map_option in projection_map_definitions:
+            # Projected maps are shown at the end of the horizon, so neither date dropdown applies
+            return get_map(snapshot, map_option, None), {'display': 'none'}, {'display': 'none'}
+
+        timeline_name = map_definitions[map_option][2]
+
+        if timeline_name == 'ev':
+            fig = get_map(snapshot, map_option, ev_date)
+            return fig, {'display': 'grid'}, {'display': 'none'}
+
+        fig = get_map(snapshot, map_option, map_date(snapshot, map_option, evcp_date))
+        return fig, {'display': 'none'}, {'display': 'grid'}
 
-    if evcp_chart_selection == 'rapid':
-        if len(location) < 1:
-            return '-', '-', '-', '-', '-', '-'
-        total_evcp_string, percent_evcp_string, evcp_information_string, evcp_information_string = set_evcp_stamp(df_evcp_rapid, 'RapidDevices')
-        stamp_title_total = 'Rapid Charge Points Change - Total'
-        stamp_title_percent = 'Rapid Charge Points Change - %'
-        return total_evcp_string, percent_evcp_string, evcp_information_string, evcp_information_string, stamp_title_total, stamp_title_percent
+    # The stamps index two cells per location, cheaper than a cache lookup, so they are not memoised
+    @app.callback([Output('ev-total-change-container', 'children'), Output('ev-percent-change-container', 'children'),
+                   Output('ev-total-change-container-information', 'children'), Output('ev-percent-change-container-information', 'children'),
+                   Output('ev-total-stamp-title', 'children'), Output('ev-percent-stamp-title', 'children')],
+                  [Input('location-dropdown', 'value'), Input('ev-date-slider', 'value'), Input('ev-chart-selection-dropdown', 'value')])
+    @metrics.timed
+    def update_stamps_ev(location, ev_time_period, ev_chart_selection):
+        metric_name, stamp_title = stamp_definitions[ev_chart_selection]
+        snapshot = reloader.current
+        return set_stamps(snapshot, metric_name, stamp_title, snapshot.ev_timeline, location, ev_time_period)
+
+
+    @app.callback([Output('evcp-total-change-container', 'children'), Output('evcp-percent-change-container', 'children'),
+                   Output('evcp-total-change-container-information', 'children'),
+                   Output('evcp-percent-change-container-information', 'children'), Output('evcp-total-stamp-title', 'children'),
+                   Output('evcp-percent-stamp-title', 'children')],
+                  [Input('location-dropdown', 'value'), Input('evcp-date-slider', 'value'), Input('evcp-chart-selection-dropdown', 'value')])
+    @metrics.timed
+    def update_stamps_evcp(location, evcp_time_period, evcp_chart_selection):
+        metric_name, stamp_title = stamp_definitions[evcp_chart_selection]
+        snapshot = reloader.current
+        return set_stamps(snapshot, metric_name, stamp_title, snapshot.evcp_timeline, location, evcp_time_period)
+
+    app_seconds = time.perf_counter() - start
+
+    # Instrumentation, a no-op unless config['metrics'] is set
+    metrics.instrument(app)
+    metrics.collect('startup_seconds', 'Seconds taken by each start up step.',
+                    lambda: {'app': app_seconds, 'data': data_seconds, 'boundaries': boundaries.load_seconds}, 'step')
+    metrics.collect('data_load_seconds', 'Seconds taken to load the current data.', lambda: reloader.load_seconds)
+    metrics.collect('data_reloads_total', 'Data reloads since start up.', lambda: reloader.reloads, kind='counter')
+    metrics.collect('cache_hits_total', 'Cache hits by cache.',
+                    lambda: {'figure': figure_cache.hits, 'callback': callback_cache and callback_cache.hits}, 'cache',
+                    'counter')
+    metrics.collect('cache_misses_total', 'Cache misses by cache.',
+                    lambda: {'figure': figure_cache.misses, 'callback': callback_cache and callback_cache.misses},
+                    'cache', 'counter')
+    metrics.collect('data_bytes', 'Bytes held by the current data by region table and metric.',
+                    lambda: data_memory_usage(reloader.current), 'part')
+    metrics.collect('figure_cache_bytes', 'Bytes held by the figure cache.', lambda: figure_cache.current_bytes)
+    metrics.register(app.server, config['metrics_path'])
+
+    if config['report_startup_time']:
+        data_mib = sum(data_memory_usage(reloader.current).values()) / 1024 ** 2
+        print(f'Dashboard created in {app_seconds:.2f}s (data {data_seconds:.2f}s, {data_mib:.1f} MiB, '
+              f"map data {config['map_data_loading']})")
+
+    return app
 
 
 if __name__ == '__main__':
-    app.run_server(debug=True)
\ No newline at end of file
+    create_app().run_server(debug=True)
@@ -0,0 +1,192 @@
+import functools
+import hashlib
+import os
+import pickle
+import time
+import uuid
+
+
+class CallbackCache:
+
+    '''
+    Memoises Dash callback results in a directory shared by every worker process, so identical requests across
+    gunicorn workers are computed once. Entries are keyed on the callback name, its inputs and a data version
+    token, so a change of data never serves a stale result. data_version may be a function returning the token when
+    the data can be reloaded while the app runs. Pointing directory at a tmpfs such as /dev/shm keeps
+    the store in shared memory. Entries are pickles, so the directory must be private: it is created with mode
+    0o700, and a directory owned by another user or writable by others is refused with a PermissionError.
+
+    Entries expire ttl seconds after they are written, and when the store grows past max_bytes the least recently
+    used entries are removed until it is a tenth under. Scanning the store costs a stat per entry, so it is only
+    done every evict_interval seconds, or sooner once the bytes written by this process take the store past
+    max_bytes. While one worker computes an entry, others asking for the same key wait up to lock_timeout seconds
+    for it rather than computing it again. hits and misses are counted per process.
+    '''
+
+    suffix = '.result'
+
+    def __init__(self, directory: str, data_version='', ttl: float = 3600, max_bytes: int = 256 * 1024 * 1024,
+                 lock_timeout: float = 10, evict_interval: float = 60):
+        self.directory = directory
+        self.data_version = data_version
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.lock_timeout = lock_timeout
+        self.evict_interval = evict_interval
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        self._check_private(directory)
+        # Size of the store at the last scan plus what this process has written since, set by evict()
+        self._bytes = 0
+        self.evict()
+
+    @staticmethod
+    def _check_private(directory: str):
+        # Anyone able to write to the directory could plant a pickle under a predictable key
+        if not hasattr(os, 'getuid'):
+            return
+        status = os.stat(directory)
+        if status.st_uid != os.getuid() or status.st_mode & 0o022:
+            raise PermissionError(f'callback cache directory {directory} must be owned by this user and not '
+                                  f'writable by others')
+
+    def key(self, name: str, args, kwargs=None):
+        data_version = self.data_version() if callable(self.data_version) else self.data_version
+        inputs = pickle.dumps((name, data_version, args, sorted((kwargs or {}).items())), protocol=4)
+        return hashlib.sha1(inputs).hexdigest()
+
+    def _path(self, key: str):
+        return os.path.join(self.directory, key + self.suffix)
+
+    def get(self, key: str):
+        '''Returns (True, value) for a live entry, otherwise (False, None).'''
+        path = self._path(key)
+        try:
+            if time.time() - os.path.getmtime(path) > self.ttl:
+                return False, None
+            with open(path, 'rb') as file:
+                value = pickle.load(file)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return False, None
+        try:
+            # Reading does not update the modification time, so bump the access time for the LRU order
+            os.utime(path, (time.time(), os.path.getmtime(path)))
+        except OSError:
+            # Evicted by another worker since it was read
+            pass
+        return True, value
+
+    def put(self, key: str, value):
+        path = self._path(key)
+        temporary_path = f'{path}.{uuid.uuid4().hex[:8]}.tmp'
+        with open(temporary_path, 'wb') as file:
+            pickle.dump(value, file, protocol=pickle.HIGHEST_PROTOCOL)
+            self._bytes += file.tell()
+        os.replace(temporary_path, path)
+        if self._bytes > self.max_bytes or time.monotonic() - self._last_evict > self.evict_interval:
+            self.evict()
+
+    def get_or_compute(self, key: str, compute):
+        found, value = self.get(key)
+        if found:
+            self.hits += 1
+            return value
+
+        lock_path = self._path(key) + '.lock'
+        token = uuid.uuid4().hex
+        if self._acquire(lock_path, token):
+            try:
+                self.misses += 1
+                value = compute()
+                self.put(key, value)
+                return value
+            finally:
+                self._release(lock_path, token)
+
+        # Another worker is computing this entry
+        deadline = time.monotonic() + self.lock_timeout
+        while time.monotonic() < deadline and os.path.exists(lock_path):
+            time.sleep(0.02)
+        found, value = self.get(key)
+        if found:
+            self.hits += 1
+            return value
+        self.misses += 1
+        return compute()
+
+    def _acquire(self, lock_path: str, token: str):
+        '''Creates the lock file holding token, so only its owner removes it. Returns False if it is held.'''
+        try:
+            descriptor = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o600)
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(lock_path) > self.lock_timeout:
+                    # Left behind by a worker that died mid computation
+                    os.remove(lock_path)
+                    return self._acquire(lock_path, token)
+            except OSError:
+                pass
+            return False
+        with os.fdopen(descriptor, 'w') as file:
+            file.write(token)
+        return True
+
+    def _release(self, lock_path: str, token: str):
+        # A lock taken over as stale by another worker after lock_timeout is now theirs, so it is left in place
+        try:
+            with open(lock_path) as file:
+                if file.read() != token:
+                    return
+            os.remove(lock_path)
+        except OSError:
+            pass
+
+    def evict(self):
+        '''Removes expired entries, then the least recently used entries until the store is within max_bytes.'''
+        self._last_evict = time.monotonic()
+        now = time.time()
+        entries = []
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith(self.suffix):
+                continue
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            if now - stat.st_mtime > self.ttl:
+                self._remove(entry.path)
+            else:
+                entries.append((max(stat.st_atime, stat.st_mtime), stat.st_size, entry.path))
+
+        total_bytes = sum(size for _, size, _ in entries)
+        # A full store is cut back by a tenth, so the writes that follow do not each trigger another scan
+        target_bytes = self.max_bytes * 0.9 if total_bytes > self.max_bytes else self.max_bytes
+        for _, size, path in sorted(entries):
+            if total_bytes <= target_bytes:
+                break
+            self._remove(path)
+            total_bytes -= size
+        self._bytes = total_bytes
+
+    @staticmethod
+    def _remove(path: str):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def clear(self):
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(self.suffix):
+                self._remove(entry.path)
+
+    def memoize(self, callback):
+        '''Decorates a Dash callback so its results are shared through the cache. Place it under @app.callback.'''
+        name = f'{callback.__module__}.{callback.__qualname__}'
+
+        @functools.wraps(callback)
+        def wrapper(*args, **kwargs):
+            return self.get_or_compute(self.key(name, args, kwargs), lambda: callback(*args, **kwargs))
+
+        return wrapper
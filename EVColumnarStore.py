@@ -0,0 +1,159 @@
+import json
+import os
+import uuid
+
+import numpy as np
+import pandas as pd
+
+
+def smallest_int_dtype(low: int, high: int):
+    '''Returns the narrowest signed or unsigned integer dtype that holds every value in [low, high].'''
+    return np.result_type(np.min_scalar_type(low), np.min_scalar_type(high))
+
+
+class ColumnarTable:
+
+    '''
+    A long format extractor table (region, date, value) held column by column with categorical codes for the
+    region and date. On disk a table is a directory holding a small manifest.json with the region and date
+    categories and one .npy file per column, each stored with the narrowest integer type that fits. read() memory
+    maps the columns, so loading is zero-copy and the pages are shared between every process that maps the table.
+
+    Regions are keyed by 'LA/RegionName'. Regions without an ONS code, such as 'Local Authority Unknown', have an
+    empty code.
+    '''
+
+    header_names = ['LA/RegionCode', 'LA/RegionName']
+    suffix = '.evtable'
+    columns = ['region_index', 'period_index', 'values']
+
+    def __init__(self, value_column: str, region_codes, region_names, periods, region_index, period_index, values):
+        self.value_column = value_column
+        self.region_codes = region_codes
+        self.region_names = region_names
+        self.periods = periods
+        self.region_index = region_index
+        self.period_index = period_index
+        self.values = values
+
+    def __len__(self):
+        return len(self.values)
+
+    @classmethod
+    def from_frame(cls, dataframe, value_column: str):
+        code_column, name_column = cls.header_names
+        region_index, region_names = pd.factorize(dataframe[name_column])
+        period_index, periods = pd.factorize(dataframe['Date'])
+        codes = dataframe[[code_column, name_column]].dropna().drop_duplicates(name_column).set_index(name_column)
+        region_codes = codes[code_column].reindex(region_names).fillna('')
+
+        values = dataframe[value_column].to_numpy(dtype=np.int64)
+        return cls(value_column, region_codes.to_numpy(dtype=object), region_names.to_numpy(dtype=object),
+                   periods.to_numpy(dtype=object),
+                   region_index.astype(smallest_int_dtype(0, len(region_names))),
+                   period_index.astype(smallest_int_dtype(0, len(periods))),
+                   values.astype(smallest_int_dtype(values.min(initial=0), values.max(initial=0))))
+
+    def to_frame(self):
+        return pd.DataFrame({self.header_names[0]: self.region_codes[self.region_index],
+                             self.header_names[1]: self.region_names[self.region_index],
+                             'Date': self.periods[self.period_index],
+                             self.value_column: self.values})
+
+    def write(self, path: str):
+        '''
+        Writes the table to a directory. Column files are written under a new version name and manifest.json,
+        which names them, is swapped in last with os.replace, so readers see either the old or the new table.
+        '''
+        os.makedirs(path, exist_ok=True)
+        version = uuid.uuid4().hex[:12]
+        files = {column: f'{column}-{version}.npy' for column in self.columns}
+        for column, file_name in files.items():
+            np.save(os.path.join(path, file_name), getattr(self, column))
+
+        manifest = {'value_column': self.value_column, 'rows': len(self), 'files': files,
+                    'region_codes': list(self.region_codes), 'region_names': list(self.region_names),
+                    'periods': list(self.periods)}
+        with open(os.path.join(path, 'manifest.json.tmp'), 'w') as file:
+            json.dump(manifest, file)
+        os.replace(os.path.join(path, 'manifest.json.tmp'), os.path.join(path, 'manifest.json'))
+
+        for file_name in os.listdir(path):
+            if file_name.endswith('.npy') and file_name not in files.values():
+                try:
+                    os.remove(os.path.join(path, file_name))
+                except OSError:
+                    # Still memory mapped by a reader on Windows, removed by the next write
+                    pass
+
+    @staticmethod
+    def read_manifest(path: str):
+        with open(os.path.join(path, 'manifest.json')) as file:
+            return json.load(file)
+
+    @classmethod
+    def read(cls, path: str, mmap: bool = True):
+        manifest = cls.read_manifest(path)
+        files = manifest.get('files', {column: column + '.npy' for column in cls.columns})
+        columns = {column: np.load(os.path.join(path, files[column]), mmap_mode='r' if mmap else None)
+                   for column in cls.columns}
+        return cls(manifest['value_column'], np.array(manifest['region_codes'], dtype=object),
+                   np.array(manifest['region_names'], dtype=object), np.array(manifest['periods'], dtype=object),
+                   **columns)
+
+
+def stored_periods(path: str):
+    '''Returns the periods already held in the table at path, reading only its manifest.'''
+    if not os.path.isdir(path):
+        return []
+    return ColumnarTable.read_manifest(path)['periods']
+
+
+def refresh_table(path: str, dataframe, value_column: str, apply_revisions: bool = False):
+    '''
+    Incrementally updates the table at path with a freshly extracted long format dataframe, which may hold every
+    period or only the new ones. Periods not yet stored are appended. Periods present in both are compared and
+    any differing (region, period) values are returned as revisions; the stored history is kept unless
+    apply_revisions is True. Returns (merged table, new periods, revisions dataframe).
+    '''
+    name_column = ColumnarTable.header_names[1]
+    periods = list(pd.unique(dataframe['Date']))
+    if not os.path.isdir(path):
+        table = ColumnarTable.from_frame(dataframe, value_column)
+        table.write(path)
+        return table, periods, pd.DataFrame(columns=[name_column, 'Date', 'Stored', 'Extracted'])
+
+    stored_table = ColumnarTable.read(path, mmap=False)
+    stored = stored_table.to_frame().rename(columns={stored_table.value_column: value_column})
+    stored_period_set = set(stored['Date'])
+    new_periods = [period for period in periods if period not in stored_period_set]
+
+    overlap = [period for period in periods if period in stored_period_set]
+    keys = [name_column, 'Date']
+    stored_overlap = stored.loc[stored['Date'].isin(overlap)].groupby(keys)[value_column].sum()
+    extracted_overlap = dataframe.loc[dataframe['Date'].isin(overlap)].groupby(keys)[value_column].sum()
+    compared = pd.concat([stored_overlap.rename('Stored'), extracted_overlap.rename('Extracted')], axis=1)
+    revisions = compared.loc[compared['Stored'].ne(compared['Extracted'])].reset_index()
+
+    if apply_revisions:
+        merged = pd.concat([dataframe, stored.loc[~stored['Date'].isin(periods)]], ignore_index=True)
+    else:
+        merged = pd.concat([dataframe.loc[dataframe['Date'].isin(new_periods)], stored], ignore_index=True)
+
+    if not new_periods and (revisions.empty or not apply_revisions):
+        return ColumnarTable.read(path), new_periods, revisions
+
+    table = ColumnarTable.from_frame(merged, value_column)
+    table.write(path)
+    return table, new_periods, revisions
+
+
+def load_table(directory: str, file_name: str, value_column: str):
+    '''
+    Loads an extractor output table, preferring the memory mapped columnar copy written next to the csv and
+    falling back to parsing the csv.
+    '''
+    columnar_path = os.path.join(directory, os.path.splitext(file_name)[0] + ColumnarTable.suffix)
+    if os.path.isdir(columnar_path):
+        return ColumnarTable.read(columnar_path)
+    return ColumnarTable.from_frame(pd.read_csv(os.path.join(directory, file_name)), value_column)
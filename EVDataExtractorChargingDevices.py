@@ -1,6 +1,13 @@
+import os
+import re
+
 import pandas as pd
 import numpy as np
 
+from EVColumnarStore import ColumnarTable, refresh_table, stored_periods
+from EVSqliteStore import write_table
+from EVWorkbook import SheetSpec, open_workbook, read_sheet
+
 class EVCPDataExtractor:
 
     '''
@@ -15,7 +22,10 @@ class EVCPDataExtractor:
     - sheet names = info, EVCD_01a, EVCD_01b, EVCD_02
     - field names = LA/Region Code, Local Authority/Region Name, Total/Rapid Devices (depending on sheet), Per100KPopulation, covers Jan, Apr, Jul, Oct for every year since Oct 2019
 
-    Data is update quarterly and can be updated by adding a new date to the dates list in the field variables below.
+    Data is updated quarterly. The dates are read from the sheet header, where each date has a total and a per 100k
+    column such as 'Total Jan-22' and 'Per 100,000 population Jan-22', so a new release needs no code change.
+    refresh() then appends only the dates not already in the target directory and reports any revisions to the
+    dates already held.
 
     Glossary:
     EVCD - Electric Vehicle Charging Devices
@@ -24,80 +34,149 @@ class EVCPDataExtractor:
 
 
     header_names = ['LA/RegionCode', 'LA/RegionName']
-    # Add when new data becomes available
-    dates = ['Jan-22', 'Oct-21', 'Jul-21', 'Apr-21', 'Jan-21', 'Oct-20', 'Jul-20', 'Apr-20', 'Jan-20', 'Oct-19']
+    # The date at the end of a column header, e.g. 'Jan-22' in 'Total Jan-22'
+    date_pattern = re.compile(r'[A-Z][a-z]{2}-\d{2}(?!\d)')
     skip_rows = 7
     skip_footer = 13
     value_name_average = 'Per100kPopulation'
 
-    def __init__(self, source_url: str, sink_url: str, sheet_name: str, value_name: str):
+    def __init__(self, source_url: str, sink_url: str, sheet_name: str, value_name: str, skip_rows: int = None,
+                 skip_footer: int = None, database_path: str = None):
         self.source_url = source_url
         self.sink_url = sink_url
         self.sheet_name = sheet_name
         self.value_name = value_name
-
-    def clean_data(self, replace_na = True):
-        total_devices_string, per_100k_string = [self.value_name, self.value_name_average]
-        final_devices_list = []
-        for col_name in self.dates:
-            final_devices_list.append(total_devices_string + col_name)
-            final_devices_list.append(per_100k_string + col_name)
-        final_devices = self.header_names + final_devices_list
-
-        df = pd.read_excel(self.source_url, sheet_name=self.sheet_name, skiprows=self.skip_rows, engine='odf',
-                      skipfooter=self.skip_footer,
-                      names=final_devices)
-
-        unpivoted_df = df.melt(id_vars=self.header_names)
-        unpivoted_df['Date'] = unpivoted_df['variable'].apply(lambda x: x[-6:])
-        unpivoted_df['variable'] = unpivoted_df['variable'].apply(lambda x: x[:-6])
-
-        total_devices_df = unpivoted_df.loc[unpivoted_df['variable'] == self.value_name]
-        per_100k_df = unpivoted_df.loc[unpivoted_df['variable'] == self.value_name_average]
-
-        total_devices_df.rename(mapper={'value': self.value_name}, inplace=True, axis=1)
-        per_100k_df.rename(mapper={'value': self.value_name_average}, inplace=True, axis=1)
-
-        total_devices_df.drop('variable', inplace=True, axis=1)
-        per_100k_df.drop('variable', inplace=True, axis=1)
-
-        total_devices_df[self.header_names[1]] = total_devices_df[self.header_names[1]].apply(lambda x: x.strip())
-        total_devices_df[self.header_names[1]] = total_devices_df[self.header_names[1]].apply(lambda x: x.lower())
-        total_devices_df[self.header_names[1]] = total_devices_df[self.header_names[1]].apply(lambda x: x.title())
-
-        per_100k_df[self.header_names[1]] = per_100k_df[self.header_names[1]].apply(lambda x: x.strip())
-        per_100k_df[self.header_names[1]] = per_100k_df[self.header_names[1]].apply(lambda x: x.lower())
-        per_100k_df[self.header_names[1]] = per_100k_df[self.header_names[1]].apply(lambda x: x.title())
-
-        if replace_na:
-
-            total_devices_df[self.value_name].replace('-', 0, inplace=True)
-            per_100k_df[self.value_name_average].replace('-', 0, inplace=True)
-
-            total_devices_df[self.value_name].replace(np.nan, 0, inplace=True)
-            per_100k_df[self.value_name_average].replace(np.nan, 0, inplace=True)
-
-        total_devices_df[self.value_name] = total_devices_df[self.value_name].apply(lambda x: int(x))
-        per_100k_df[self.value_name_average] = per_100k_df[self.value_name_average].apply(lambda x: int(x))
+        if skip_rows is not None:
+            self.skip_rows = skip_rows
+        if skip_footer is not None:
+            self.skip_footer = skip_footer
+        # Optional SQLite database the output is also written to
+        self.database_path = database_path
+
+    @classmethod
+    def extract_workbook(cls, source_url: str, sink_url: str, sheet_specs: list, replace_na = True,
+                         streaming: bool = False):
+        '''
+        Parses the workbook once and returns {sheet name: (total devices dataframe, per 100k dataframe)} for a list
+        of SheetSpecs. With streaming=True only the requested sheets are read, without building a DOM of the whole
+        workbook.
+        '''
+        sheet_names = [spec.sheet_name for spec in sheet_specs]
+        with open_workbook(source_url, streaming, sheet_names) as workbook:
+            return {spec.sheet_name: cls(source_url, sink_url, *spec).clean_data(replace_na, workbook)
+                    for spec in sheet_specs}
+
+    def clean_data(self, replace_na = True, workbook=None):
+        # workbook is an already opened workbook of the source (see open_workbook), otherwise source_url is read
+        source = self.source_url if workbook is None else workbook
+        df = read_sheet(source, self.sheet_name, self.skip_rows, self.skip_footer)
+
+        return self.clean_frame(df, replace_na)
+
+    def header_dates(self, columns):
+        '''
+        Returns the date of each pair of total and per 100k columns after the two region columns of a sheet header.
+        Raises ValueError unless the columns come in pairs with the same date.
+        '''
+        labels = [str(column) for column in columns[2:]]
+        dates = [self.date_pattern.findall(label)[-1:] for label in labels]
+        if len(labels) % 2 or not all(total and total == average for total, average in zip(dates[0::2], dates[1::2])):
+            raise ValueError(f'{self.sheet_name}: expected a total and a per 100k column for each date, found {labels}')
+        return [total[0] for total in dates[0::2]]
+
+    def clean_frame(self, df, replace_na = True, dates=None):
+        '''
+        Un-pivots and cleans a sheet as read from the workbook. The sheet interleaves total and per 100k columns for
+        each date, so the two are split by position before melting. Names are normalised once per region and each
+        value block is cleaned and cast to int in a single pass. dates defaults to the dates in the sheet header.
+        '''
+        dates = self.header_dates(df.columns) if dates is None else dates
+        codes = df.iloc[:, 0].to_numpy()
+        names = df.iloc[:, 1].str.strip().str.title().to_numpy()
+        values = df.iloc[:, 2:].to_numpy(dtype=object)
+
+        def unpivot(block, value_name):
+            if replace_na:
+                block[pd.isna(block) | (block == '-')] = 0
+            # Column-major ravel gives the same row order as DataFrame.melt, every region for one date at a time
+            return pd.DataFrame({self.header_names[0]: np.tile(codes, len(dates)),
+                                 self.header_names[1]: np.tile(names, len(dates)),
+                                 value_name: block.astype(np.int64).ravel(order='F'),
+                                 'Date': np.repeat(dates, len(codes))})
+
+        total_devices_df = unpivot(values[:, 0::2], self.value_name)
+        per_100k_df = unpivot(values[:, 1::2], self.value_name_average)
 
         return total_devices_df, per_100k_df
 
     def write_date(self, dataframe, dataframe_average, file_name, file_name_average):
-        dataframe.to_csv(self.sink_url + '\\' + file_name, index=False)
-        dataframe_average.to_csv(self.sink_url + '\\' + file_name_average, index=False)
+        dataframe.to_csv(os.path.join(self.sink_url, file_name), index=False)
+        dataframe_average.to_csv(os.path.join(self.sink_url, file_name_average), index=False)
+        tables = self.write_columnar(dataframe, dataframe_average, file_name, file_name_average)
+        for table, name in zip(tables, [file_name, file_name_average]):
+            self.write_database(table, name)
+
+    def write_columnar(self, dataframe, dataframe_average, file_name, file_name_average):
+        # Typed columnar copies next to the csvs, memory mapped by the dashboard
+        tables = []
+        for df, value_name, name in [(dataframe, self.value_name, file_name),
+                                     (dataframe_average, self.value_name_average, file_name_average)]:
+            table = ColumnarTable.from_frame(df, value_name)
+            table.write(os.path.join(self.sink_url, os.path.splitext(name)[0] + ColumnarTable.suffix))
+            tables.append(table)
+        return tables
+
+    def write_database(self, table, file_name):
+        # The metric is named after the output file, e.g. charge_points_devices_total
+        if self.database_path:
+            write_table(self.database_path, os.path.splitext(file_name)[0], table)
+
+    def refresh(self, file_name, file_name_average, replace_na = True, workbook=None, validate=True,
+                apply_revisions=False):
+        '''
+        Incrementally updates the total and per 100k outputs with the dates not already in the target directory.
+        With validate the dates already held are extracted as well and compared, and any revised values are
+        returned; they are only written with apply_revisions. Without validate only the new date columns are
+        cleaned. Each csv and columnar copy is replaced atomically, and the database in one transaction.
+        Returns {file name: (new dates, revisions)} for both outputs.
+        '''
+        source = self.source_url if workbook is None else workbook
+        df = read_sheet(source, self.sheet_name, self.skip_rows, self.skip_footer)
+
+        outputs = [(file_name, self.value_name), (file_name_average, self.value_name_average)]
+        table_paths = [os.path.join(self.sink_url, os.path.splitext(name)[0] + ColumnarTable.suffix)
+                       for name, _ in outputs]
+        dates = self.header_dates(df.columns)
+        if not validate:
+            stored = set(stored_periods(table_paths[0])) & set(stored_periods(table_paths[1]))
+            positions = [i for i, date in enumerate(dates) if date not in stored]
+            dates = [dates[i] for i in positions]
+            df = df.iloc[:, [0, 1] + [2 + 2 * i + offset for i in positions for offset in (0, 1)]]
+
+        results = {}
+        for (name, value_name), table_path, frame in zip(outputs, table_paths, self.clean_frame(df, replace_na, dates)):
+            table, new_dates, revisions = refresh_table(table_path, frame, value_name, apply_revisions)
+            if new_dates or (apply_revisions and not revisions.empty):
+                csv_path = os.path.join(self.sink_url, name)
+                table.to_frame()[self.header_names + [value_name, 'Date']].to_csv(csv_path + '.tmp', index=False)
+                os.replace(csv_path + '.tmp', csv_path)
+                self.write_database(table, name)
+            results[name] = (new_dates, revisions)
+
+        return results
 
 if __name__ == '__main__':
-    evcp_data_total = EVCPDataExtractor('https://assets.publishing.service.gov.uk/government/uploads/system/uploads/attachment_data/file/1048354/electric-vehicle-charging-device-statistics-january-2022.ods',
-                                  r'C:\Users\Win 10 user\OneDrive\EV Dashboard\Source Data\Charge Points', 'EVCD_01a', 'TotalDevices')
-    total_devices_df, per_100k_df_total = evcp_data_total.clean_data()
+    source_url = 'https://assets.publishing.service.gov.uk/government/uploads/system/uploads/attachment_data/file/1048354/electric-vehicle-charging-device-statistics-january-2022.ods'
+    sink_url = r'C:\Users\Win 10 user\OneDrive\EV Dashboard\Source Data\Charge Points'
+    sheets = EVCPDataExtractor.extract_workbook(source_url, sink_url, [SheetSpec('EVCD_01a', 'TotalDevices'),
+                                                                       SheetSpec('EVCD_01b', 'RapidDevices')],
+                                                streaming=True)
+
+    evcp_data_total = EVCPDataExtractor(source_url, sink_url, 'EVCD_01a', 'TotalDevices')
+    total_devices_df, per_100k_df_total = sheets['EVCD_01a']
     evcp_data_total.write_date(total_devices_df, per_100k_df_total, 'charge_points_devices_total.csv', 'charge_points_per_100k_total.csv')
 
-    evcp_data_rapid = EVCPDataExtractor(
-        'https://assets.publishing.service.gov.uk/government/uploads/system/uploads/attachment_data/file/1048354/electric-vehicle-charging-device-statistics-january-2022.ods',
-        r'C:\Users\Win 10 user\OneDrive\EV Dashboard\Source Data\Charge Points', 'EVCD_01b', 'RapidDevices')
-    rapid_devices_df, per_100k_df_rapid = evcp_data_rapid.clean_data()
+    evcp_data_rapid = EVCPDataExtractor(source_url, sink_url, 'EVCD_01b', 'RapidDevices')
+    rapid_devices_df, per_100k_df_rapid = sheets['EVCD_01b']
     evcp_data_rapid.write_date(rapid_devices_df, per_100k_df_rapid, 'charge_points_devices_rapid.csv',
                                'charge_points_per_100k_rapid.csv')
-
-
-
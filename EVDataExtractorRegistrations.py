@@ -1,5 +1,12 @@
+import os
+
+import numpy as np
 import pandas as pd
 
+from EVColumnarStore import ColumnarTable, refresh_table, stored_periods
+from EVSqliteStore import write_table
+from EVWorkbook import SheetSpec, open_workbook, read_sheet
+
 class EVDataExtractor:
 
     '''
@@ -8,7 +15,8 @@ class EVDataExtractor:
     Primarily for the use of the EV infrastructure planning tool. The script extracts the whole dataset and outputs
     one sheet at a time into the target destination.
 
-    The data is updated quarterly. Latest data is 2021 Q3.
+    The data is updated quarterly. Latest data is 2021 Q3. refresh() appends only the quarters not already in the
+    target directory and reports any revisions DfT have made to the quarters already held.
 
     The source metadata can be seen below:
     - url = 'https://assets.publishing.service.gov.uk/government/uploads/system/uploads/attachment_data/file/1046001/veh0132.ods'
@@ -31,61 +39,112 @@ class EVDataExtractor:
     skip_rows = 6
     skip_footer = 14
 
-    def __init__(self, source_url: str, sink_url: str, sheet_name: str, value_name: str):
+    def __init__(self, source_url: str, sink_url: str, sheet_name: str, value_name: str, skip_rows: int = None,
+                 skip_footer: int = None, database_path: str = None):
         self.source_url = source_url
         self.sink_url = sink_url
         self.sheet_name = sheet_name
         self.value_name = value_name
-
-    def clean_data(self):
-        df = pd.read_excel(self.source_url, sheet_name=self.sheet_name, skiprows=6, skipfooter=14)
-
-        df.rename(mapper={df.columns[0]: self.header_names[0], df.columns[1]: self.header_names[1]},
-                  inplace=True, axis=1)
-
-        df_pivoted = df.melt(id_vars=self.header_names, var_name='Date', value_name=self.value_name)
-
-        df_pivoted['LA/RegionName'] = df_pivoted['LA/RegionName'].apply(lambda x: x.strip())
-        df_pivoted['LA/RegionName'] = df_pivoted['LA/RegionName'].apply(lambda x: x.lower())
-        df_pivoted['LA/RegionName'] = df_pivoted['LA/RegionName'].apply(lambda x: x.title())
-
-        df_pivoted[self.value_name].replace('c', 0.0, inplace=True)
-
-        df_pivoted[self.value_name] = df_pivoted[self.value_name].apply(lambda x: int(x))
+        if skip_rows is not None:
+            self.skip_rows = skip_rows
+        if skip_footer is not None:
+            self.skip_footer = skip_footer
+        # Optional SQLite database the output is also written to
+        self.database_path = database_path
+
+    @classmethod
+    def extract_workbook(cls, source_url: str, sink_url: str, sheet_specs: list, streaming: bool = False):
+        '''
+        Parses the workbook once and returns {sheet name: cleaned dataframe} for a list of SheetSpecs. With
+        streaming=True only the requested sheets are read, without building a DOM of the whole workbook.
+        '''
+        sheet_names = [spec.sheet_name for spec in sheet_specs]
+        with open_workbook(source_url, streaming, sheet_names) as workbook:
+            return {spec.sheet_name: cls(source_url, sink_url, *spec).clean_data(workbook) for spec in sheet_specs}
+
+    def clean_data(self, workbook=None):
+        # workbook is an already opened workbook of the source (see open_workbook), otherwise source_url is read
+        source = self.source_url if workbook is None else workbook
+        df = read_sheet(source, self.sheet_name, self.skip_rows, self.skip_footer)
+
+        return self.clean_frame(df)
+
+    def clean_frame(self, df):
+        '''
+        Un-pivots and cleans a sheet as read from the workbook. Names are normalised once per region before the
+        melt and the 'c' (suppressed) values are zeroed and cast to int in a single pass over the value block.
+        '''
+        codes = df.iloc[:, 0].to_numpy()
+        names = df.iloc[:, 1].str.strip().str.title().to_numpy()
+        dates = df.columns[2:].to_numpy()
+
+        values = df.iloc[:, 2:].to_numpy(dtype=object)
+        values[values == 'c'] = 0
+        values = values.astype(np.int64)
+
+        # Column-major ravel gives the same row order as DataFrame.melt, every region for one date at a time
+        df_pivoted = pd.DataFrame({self.header_names[0]: np.tile(codes, len(dates)),
+                                   self.header_names[1]: np.tile(names, len(dates)),
+                                   'Date': np.repeat(dates, len(codes)),
+                                   self.value_name: values.ravel(order='F')})
 
         return df_pivoted
 
     def write_date(self, dataframe, file_name):
-        dataframe.to_csv(self.sink_url + '\\' + file_name)
-        # Add in write to database
+        dataframe.to_csv(os.path.join(self.sink_url, file_name), index=False)
+        table = self.write_columnar(dataframe, file_name)
+        self.write_database(table, file_name)
+
+    def write_columnar(self, dataframe, file_name):
+        # Typed columnar copy next to the csv, memory mapped by the dashboard
+        table = ColumnarTable.from_frame(dataframe, self.value_name)
+        table.write(os.path.join(self.sink_url, os.path.splitext(file_name)[0] + ColumnarTable.suffix))
+        return table
+
+    def write_database(self, table, file_name):
+        # The metric is named after the output file, e.g. ev_registrations_ulev
+        if self.database_path:
+            write_table(self.database_path, os.path.splitext(file_name)[0], table)
+
+    def refresh(self, file_name, workbook=None, validate=True, apply_revisions=False):
+        '''
+        Incrementally updates the output for file_name with the periods not already in the target directory.
+        With validate the periods already held are extracted as well and compared, and any revised values are
+        returned; they are only written with apply_revisions. Without validate only the new date columns are
+        cleaned. The csv and columnar copy are each replaced atomically, and the database in one transaction.
+        Returns (new periods, revisions).
+        '''
+        source = self.source_url if workbook is None else workbook
+        df = read_sheet(source, self.sheet_name, self.skip_rows, self.skip_footer)
+
+        table_path = os.path.join(self.sink_url, os.path.splitext(file_name)[0] + ColumnarTable.suffix)
+        if not validate:
+            stored = set(stored_periods(table_path))
+            df = df[[column for i, column in enumerate(df.columns) if i < 2 or column not in stored]]
+
+        table, new_periods, revisions = refresh_table(table_path, self.clean_frame(df), self.value_name,
+                                                      apply_revisions)
+        if new_periods or (apply_revisions and not revisions.empty):
+            csv_path = os.path.join(self.sink_url, file_name)
+            table.to_frame().to_csv(csv_path + '.tmp', index=False)
+            os.replace(csv_path + '.tmp', csv_path)
+            self.write_database(table, file_name)
+
+        return new_periods, revisions
 
 if __name__ == '__main__':
-    total_ulev_data = EVDataExtractor('https://assets.publishing.service.gov.uk/government/uploads/system/uploads/attachment_data/file/1046001/veh0132.ods',
-                                      r'C:\Users\Win 10 user\OneDrive\EV Dashboard\Source Data\Charge Points', 'VEH0132a_All',
-                                      'ULEVRegistrations')
-    total_ulev_df = total_ulev_data.clean_data()
-    total_ulev_data.write_date(total_ulev_df, 'ev_registrations_ulev.csv')
-
-    total_bev_data = EVDataExtractor(
-        'https://assets.publishing.service.gov.uk/government/uploads/system/uploads/attachment_data/file/1046001/veh0132.ods',
-        r'C:\Users\Win 10 user\OneDrive\EV Dashboard\Source Data\Charge Points', 'VEH0132b_BEV',
-        'BEVRegistrations')
-    total_bev_df = total_bev_data.clean_data()
-    total_bev_data.write_date(total_bev_df, 'ev_registrations_bev.csv')
-
-    total_phev_data = EVDataExtractor(
-        'https://assets.publishing.service.gov.uk/government/uploads/system/uploads/attachment_data/file/1046001/veh0132.ods',
-        r'C:\Users\Win 10 user\OneDrive\EV Dashboard\Source Data\Charge Points', 'VEH0132c_PHEV',
-        'PHEVRegistrations')
-    total_phev_df = total_phev_data.clean_data()
-    total_phev_data.write_date(total_phev_df, 'ev_registrations_phev.csv')
-
-
-
-
-
-
-
+    source_url = 'https://assets.publishing.service.gov.uk/government/uploads/system/uploads/attachment_data/file/1046001/veh0132.ods'
+    sink_url = r'C:\Users\Win 10 user\OneDrive\EV Dashboard\Source Data\Charge Points'
+    sheets = EVDataExtractor.extract_workbook(source_url, sink_url, [SheetSpec('VEH0132a_All', 'ULEVRegistrations'),
+                                                                     SheetSpec('VEH0132b_BEV', 'BEVRegistrations'),
+                                                                     SheetSpec('VEH0132c_PHEV', 'PHEVRegistrations')],
+                                              streaming=True)
 
+    total_ulev_data = EVDataExtractor(source_url, sink_url, 'VEH0132a_All', 'ULEVRegistrations')
+    total_ulev_data.write_date(sheets['VEH0132a_All'], 'ev_registrations_ulev.csv')
 
+    total_bev_data = EVDataExtractor(source_url, sink_url, 'VEH0132b_BEV', 'BEVRegistrations')
+    total_bev_data.write_date(sheets['VEH0132b_BEV'], 'ev_registrations_bev.csv')
 
+    total_phev_data = EVDataExtractor(source_url, sink_url, 'VEH0132c_PHEV', 'PHEVRegistrations')
+    total_phev_data.write_date(sheets['VEH0132c_PHEV'], 'ev_registrations_phev.csv')
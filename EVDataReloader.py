@@ -0,0 +1,75 @@
+import os
+import threading
+import time
+import traceback
+
+
+class DataReloader:
+
+    '''
+    Holds the dashboard's current data snapshot and replaces it when the extractors publish new output, without
+    restarting the server. A watcher thread compares fingerprint() every interval seconds; when it changes, load()
+    builds a complete new snapshot on that thread and prepare(snapshot) warms the caches for it while requests are
+    still answered from the old one. The new snapshot is then swapped in with a single assignment, so a request
+    that reads current once always sees one consistent snapshot, and retire(old snapshot) can drop what was cached
+    for the data it replaced.
+
+    A failed load leaves the current snapshot in place and is retried at the next check, so output caught half
+    written is picked up once the extractor finishes. The watcher is started per process by start(), which is safe
+    to call on every request, so each forked gunicorn worker runs its own.
+    '''
+
+    def __init__(self, load, fingerprint, prepare=None, retire=None, interval: float = 60):
+        self.load = load
+        self.fingerprint = fingerprint
+        self.prepare = prepare
+        self.retire = retire
+        self.interval = interval
+        self._fingerprint = fingerprint()
+        start = time.perf_counter()
+        self.current = load()
+        self.load_seconds = time.perf_counter() - start
+        self.reloads = 0
+        self.last_error = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._start_lock = threading.Lock()
+
+    def check(self):
+        '''Reloads when the source data has changed since the current snapshot was loaded. Returns True on a swap.'''
+        with self._lock:
+            # Taken before loading, so a change made during the load is seen at the next check
+            fingerprint = self.fingerprint()
+            if fingerprint == self._fingerprint:
+                return False
+
+            start = time.perf_counter()
+            snapshot = self.load()
+            self.load_seconds = time.perf_counter() - start
+            if self.prepare:
+                self.prepare(snapshot)
+            previous, self.current = self.current, snapshot
+            if self.retire:
+                self.retire(previous)
+            self._fingerprint = fingerprint
+            self.reloads += 1
+            print(f'Data reloaded in {time.perf_counter() - start:.2f}s')
+            return True
+
+    def _watch(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.check()
+            except Exception:
+                self.last_error = traceback.format_exc()
+                print(f'Data reload failed, keeping the current data:\n{self.last_error}')
+
+    def start(self):
+        '''Starts the watcher thread in this process if it is not already running.'''
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                threading.Thread(target=self._watch, name='data-reloader', daemon=True).start()
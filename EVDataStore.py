@@ -0,0 +1,233 @@
+import base64
+from collections import namedtuple
+from datetime import datetime
+import hashlib
+import sys
+
+import numpy as np
+import pandas as pd
+
+from EVColumnarStore import smallest_int_dtype
+
+
+def parse_period(label: str) -> datetime:
+    '''
+    Returns the first day of a DfT period label. The registrations data uses quarters ('2021 Q3') and
+    the charging device data uses monthly snapshots ('Jan-22').
+    '''
+    if ' Q' in label:
+        year, quarter = label.split(' Q')
+        return datetime(int(year), 3 * int(quarter) - 2, 1)
+    return datetime.strptime(label, '%b-%y')
+
+
+# Per location change between two slider positions, as shown on the KPI stamps
+ChangeStatistics = namedtuple('ChangeStatistics', ['start_values', 'end_values', 'change', 'percent', 'present'])
+
+
+def compute_change_statistics(start_values, end_values, present):
+    '''
+    Returns the ChangeStatistics for arrays of start and end values. As on the original stamps an end count below 1
+    is floored to 1, while fractional values such as the derived ratios are kept as they are. percent is NaN where
+    the start value is 0.
+    '''
+    start_values, end_values = np.asarray(start_values), np.asarray(end_values)
+    if start_values.dtype.kind == 'f' or end_values.dtype.kind == 'f':
+        start_values, end_values = start_values.astype(np.float64), end_values.astype(np.float64)
+    else:
+        start_values = start_values.astype(np.int64)
+        end_values = np.maximum(end_values.astype(np.int64), 1)
+    change = end_values - start_values
+    percent = np.full(len(start_values), np.nan)
+    np.divide(change, start_values, out=percent, where=start_values != 0)
+    percent *= 100
+    return ChangeStatistics(start_values, end_values, change, percent, present)
+
+
+def encode_series_store(periods, regions, values, present):
+    '''
+    Encodes (region x period) values and their present mask for the clientside line charts, as base64 little endian
+    typed arrays in row major order, int32 when the values are whole numbers that fit and float64 otherwise.
+    '''
+    int32 = np.iinfo(np.int32)
+    whole = values.dtype.kind in 'iu' or np.array_equal(values, np.rint(values))
+    dtype = 'int32' if values.size == 0 or whole and int32.min <= values.min() and values.max() <= int32.max \
+        else 'float64'
+    return {'periods': list(periods), 'regions': list(regions), 'dtype': dtype,
+            'values': base64.b64encode(values.astype('<i4' if dtype == 'int32' else '<f8').tobytes()).decode('ascii'),
+            'present': base64.b64encode(present.astype(np.uint8).tobytes()).decode('ascii')}
+
+
+class Timeline:
+
+    '''
+    The ordered periods shared by a family of metrics, oldest first. The position of a period in the
+    timeline is the value used by the date sliders, so this is the single source of period ordering.
+    '''
+
+    def __init__(self, periods):
+        self.periods = sorted(set(periods), key=parse_period)
+        self.period_index = {period: i for i, period in enumerate(self.periods)}
+
+    def __len__(self):
+        return len(self.periods)
+
+    @property
+    def marks(self):
+        return {i: period for i, period in enumerate(self.periods)}
+
+    @property
+    def latest(self):
+        return self.periods[-1]
+
+
+class MetricCube:
+
+    '''
+    A single metric held as a dense (region x period) array. Cells with no source row are flagged False in
+    present so they can be told apart from genuine zero counts.
+    '''
+
+    def __init__(self, name: str, value_column: str, timeline: Timeline, values, present):
+        self.name = name
+        self.value_column = value_column
+        self.timeline = timeline
+        self.values = values
+        self.present = present
+
+
+class EVDataStore:
+
+    '''
+    Holds every dashboard metric as a dense (region x period) array with region and period index maps, built
+    once at start up from the long format extractor output. Callbacks slice the arrays directly so the cost of a
+    request scales with the cells selected rather than with the rows in the source tables.
+
+    All metrics share one region dimension, keyed by 'LA/RegionName' as used by the location dropdown, so each
+    region name and code is held once however many metrics there are. Rows that repeat a (region, period) pair,
+    such as the per-region 'Local Authority Unknown' rows, are summed, and each cube is then narrowed to the
+    smallest integer type that holds its values.
+    '''
+
+    header_names = ['LA/RegionCode', 'LA/RegionName']
+
+    def __init__(self, regions, region_codes, timelines: dict, metrics: dict):
+        self.regions = regions
+        self.region_codes = region_codes
+        self.region_index = {name: i for i, name in enumerate(regions)}
+        self.timelines = timelines
+        self.metrics = metrics
+        self.version = self.data_version()
+
+    @classmethod
+    def from_tables(cls, sources: dict):
+        '''
+        Builds the store from {metric name: (ColumnarTable, value column, timeline name)}. The region dimension keeps
+        the order regions first appear in across the sources.
+        '''
+        tables = [table for table, _, _ in sources.values()]
+        regions = pd.Index(pd.unique(np.concatenate([table.region_names for table in tables])))
+        region_codes = np.full(len(regions), '', dtype=object)
+        for table in reversed(tables):
+            has_code = table.region_codes != ''
+            region_codes[regions.get_indexer(table.region_names[has_code])] = table.region_codes[has_code]
+
+        timeline_periods = {}
+        for table, _, timeline_name in sources.values():
+            timeline_periods.setdefault(timeline_name, set()).update(table.periods)
+        timelines = {timeline_name: Timeline(periods) for timeline_name, periods in timeline_periods.items()}
+
+        metrics = {}
+        for metric_name, (table, value_column, timeline_name) in sources.items():
+            timeline = timelines[timeline_name]
+            rows = regions.get_indexer(table.region_names)[table.region_index]
+            columns = pd.Index(timeline.periods).get_indexer(table.periods)[table.period_index]
+
+            values = np.zeros((len(regions), len(timeline)), dtype=np.int64)
+            present = np.zeros((len(regions), len(timeline)), dtype=bool)
+            np.add.at(values, (rows, columns), table.values)
+            present[rows, columns] = True
+            values = values.astype(smallest_int_dtype(values.min(initial=0), values.max(initial=0)))
+
+            metrics[metric_name] = MetricCube(metric_name, value_column, timeline, values, present)
+
+        return cls(regions.to_numpy(dtype=object), region_codes, timelines, metrics)
+
+    def data_version(self):
+        '''
+        Returns a token that changes whenever any region, period or value changes, used to key cached results.
+        '''
+        sha = hashlib.sha1('\n'.join(self.regions).encode('utf-8'))
+        for metric_name in sorted(self.metrics):
+            metric = self.metrics[metric_name]
+            sha.update(f'{metric_name}|{"|".join(metric.timeline.periods)}'.encode('utf-8'))
+            sha.update(np.ascontiguousarray(metric.values).tobytes())
+            sha.update(np.ascontiguousarray(metric.present).tobytes())
+        return sha.hexdigest()[:16]
+
+    def memory_usage(self):
+        '''Returns the bytes held by the region table and by each metric's values and present mask.'''
+        strings = sum(sys.getsizeof(value) for value in self.regions) + \
+                  sum(sys.getsizeof(value) for value in self.region_codes)
+        usage = {'regions': self.regions.nbytes + self.region_codes.nbytes + strings}
+        for metric_name, metric in self.metrics.items():
+            usage[metric_name] = metric.values.nbytes + metric.present.nbytes
+        return usage
+
+    def region_names(self, metric_name: str):
+        return list(self.regions[self.metrics[metric_name].present.any(axis=1)])
+
+    def codes_for(self, regions):
+        '''Returns the region code of each region name, '' for names without one.'''
+        rows = pd.Index(self.regions).get_indexer(regions)
+        return np.where(rows >= 0, self.region_codes[np.maximum(rows, 0)], '').astype(object)
+
+    def metric_cube(self, metric_name: str):
+        '''Returns the regions with data for a metric and their (region x period) values and present mask.'''
+        metric = self.metrics[metric_name]
+        rows = metric.present.any(axis=1)
+        return self.regions[rows], metric.values[rows], metric.present[rows]
+
+    def series_store(self, metric_name: str):
+        '''
+        Returns the series of every region with data for a metric in the compact form sent to the browser for the
+        clientside line charts, see encode_series_store.
+        '''
+        return encode_series_store(self.metrics[metric_name].timeline.periods, *self.metric_cube(metric_name))
+
+    def latest_period(self, metric_name: str, period: str):
+        '''Returns the latest period up to and including period with data for the metric, or period if none has.'''
+        metric = self.metrics[metric_name]
+        if period not in metric.timeline.period_index:
+            return period
+        columns = np.flatnonzero(metric.present[:, :metric.timeline.period_index[period] + 1].any(axis=0))
+        return metric.timeline.periods[columns[-1]] if len(columns) else period
+
+    def change_statistics(self, metric_name: str, locations: list, start: int, end: int):
+        '''
+        Returns the ChangeStatistics of every location between two slider positions, indexed straight out of the
+        metric cube in one call. present is False for locations without data at either position.
+        '''
+        metric = self.metrics[metric_name]
+        rows = np.array([self.region_index.get(location, -1) for location in locations], dtype=np.int64)
+        known = rows >= 0
+        rows = np.where(known, rows, 0)
+
+        present = known & metric.present[rows, start] & metric.present[rows, end]
+        return compute_change_statistics(np.where(known, metric.values[rows, start], 0),
+                                         np.where(known, metric.values[rows, end], 0), present)
+
+    def period_frame(self, metric_name: str, period: str):
+        '''
+        Returns the code, name and value of every region with data for one period, as used by the map. The frame is
+        empty for a period outside the metric's timeline, such as None from a cleared date dropdown.
+        '''
+        metric = self.metrics[metric_name]
+        column = metric.timeline.period_index.get(period)
+        if column is None:
+            keep, column = np.zeros(len(self.regions), dtype=bool), 0
+        else:
+            keep = metric.present[:, column] & (self.region_codes != '')
+        return pd.DataFrame({self.header_names[0]: self.region_codes[keep],
+                             self.header_names[1]: self.regions[keep],
+                             metric.value_column: metric.values[keep, column]})
@@ -0,0 +1,93 @@
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from EVDataStore import EVDataStore, MetricCube, parse_period
+
+# A metric derived as numerator / denominator for every region and period of the denominator's timeline
+RatioMetric = namedtuple('RatioMetric', ['numerator', 'denominator', 'value_column'])
+
+
+def observation_month(label: str) -> int:
+    '''
+    Returns the month a DfT period was counted at, numbered from year 0. The charging device snapshots count the
+    devices on the first of their month, and the registrations count the vehicles licensed at the end of their
+    quarter, so a quarter is taken as observed on the first day of the next one: '2021 Q3' lines up with 'Oct-21'.
+    '''
+    date = parse_period(label)
+    month = date.year * 12 + date.month - 1
+    return month + 3 if ' Q' in label else month
+
+
+class TimeAlignment:
+
+    '''
+    Maps the periods of every timeline onto one calendar of observation months, held in months as the month number
+    each period was counted at, so metrics sampled on different timelines, such as quarterly registrations and
+    monthly charging device snapshots, can be combined cell by cell. index(source, target) gives for each target
+    period the source period observed at or most recently before it, no more than max_lag_months earlier, so a
+    target period with no recent enough source observation is left out rather than paired with stale data. Indexes
+    are computed once per pair of timelines.
+    '''
+
+    def __init__(self, timelines: dict, max_lag_months: int = 2):
+        self.timelines = timelines
+        self.max_lag_months = max_lag_months
+        self.months = {name: np.array([observation_month(period) for period in timeline.periods], dtype=np.int64)
+                       for name, timeline in timelines.items()}
+        self._indexes = {}
+
+    def index(self, source: str, target: str):
+        '''Returns the position in the source timeline aligned with each target period, -1 where there is none.'''
+        if (source, target) not in self._indexes:
+            source_months, target_months = self.months[source], self.months[target]
+            positions = np.searchsorted(source_months, target_months, side='right') - 1
+            lag = target_months - source_months[np.maximum(positions, 0)] if len(source_months) else 0
+            self._indexes[source, target] = np.where((positions >= 0) & (lag <= self.max_lag_months), positions, -1)
+        return self._indexes[source, target]
+
+
+def timeline_name(data_store, metric_name: str):
+    timeline = data_store.metrics[metric_name].timeline
+    return next(name for name, candidate in data_store.timelines.items() if candidate is timeline)
+
+
+def derive_metrics(data_store, definitions: dict, alignment: TimeAlignment):
+    '''
+    Builds an EVDataStore of the RatioMetrics in definitions from the metric cubes of data_store, either backend.
+    Each ratio is computed for every region and period in one vectorised pass, with the numerator taken at the
+    period aligned with each denominator period. A cell is present where both inputs are and the denominator is not
+    zero. Ratios are kept to one decimal place, since small ratios such as BEVs per rapid device in rural regions
+    would lose most of their meaning as whole numbers. Derived metrics are served by the same chart, map and stamp
+    code as the metrics they come from.
+    '''
+    cubes = {}
+    for metric_name, definition in definitions.items():
+        regions, values, present = data_store.metric_cube(definition.denominator)
+        numerator_regions, numerator_values, numerator_present = data_store.metric_cube(definition.numerator)
+        rows = pd.Index(numerator_regions).get_indexer(regions)
+        columns = alignment.index(timeline_name(data_store, definition.numerator),
+                                  timeline_name(data_store, definition.denominator))
+
+        aligned = (rows[:, None] >= 0) & (columns[None, :] >= 0)
+        rows, columns = np.maximum(rows, 0), np.maximum(columns, 0)
+        present = present & aligned & numerator_present[rows[:, None], columns[None, :]] & (values > 0)
+        ratio = np.zeros(values.shape, dtype=np.float64)
+        np.divide(numerator_values[rows[:, None], columns[None, :]], values, out=ratio, where=present)
+        cubes[metric_name] = (regions, np.round(ratio, 1), present)
+
+    region_index = pd.Index(pd.unique(np.concatenate([np.zeros(0, dtype=object)] +
+                                                     [regions for regions, _, _ in cubes.values()])))
+    metrics = {}
+    for metric_name, (regions, ratio, present) in cubes.items():
+        definition = definitions[metric_name]
+        rows = region_index.get_indexer(regions)
+        values = np.zeros((len(region_index), ratio.shape[1]), dtype=ratio.dtype)
+        cells = np.zeros(values.shape, dtype=bool)
+        values[rows], cells[rows] = ratio, present
+        metrics[metric_name] = MetricCube(metric_name, definition.value_column,
+                                          data_store.metrics[definition.denominator].timeline, values, cells)
+
+    regions = region_index.to_numpy(dtype=object)
+    return EVDataStore(regions, data_store.codes_for(regions), data_store.timelines, metrics)
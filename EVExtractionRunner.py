@@ -0,0 +1,137 @@
+'''
+Runs every extraction job listed in a job manifest across a process pool and reports per job timing and
+failures. The manifest is a json file of the form:
+
+{
+  "sink_url": "<target directory>",
+  "database": "<optional SQLite database every output is also written to>",
+  "workbooks": {"registrations": "<veh0132.ods path or url>", "charging_devices": "<charging device .ods path or url>"},
+  "jobs": [
+    {"workbook": "registrations", "sheet_name": "VEH0132a_All", "value_name": "ULEVRegistrations",
+     "file_name": "ev_registrations_ulev.csv"},
+    {"workbook": "charging_devices", "sheet_name": "EVCD_01a", "value_name": "TotalDevices",
+     "file_name": "charge_points_devices_total.csv", "file_name_average": "charge_points_per_100k_total.csv"}
+  ]
+}
+
+Workbooks given as urls are downloaded once before the jobs start, local paths are used as they are so the runner
+works fully offline. Each job streams only its own sheet. Usage:
+    python EVExtractionRunner.py [manifest.json] [--workers N] [--incremental]
+'''
+
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import json
+import os
+import sys
+import time
+import traceback
+import urllib.request
+
+from EVDataExtractorChargingDevices import EVCPDataExtractor
+from EVDataExtractorRegistrations import EVDataExtractor
+from EVWorkbook import open_workbook
+
+# new_periods and revisions are set in incremental runs, revisions counting the stored values the source now differs
+# from. Revisions are reported but not written, the stored history is kept.
+JobResult = namedtuple('JobResult', ['sheet_name', 'file_name', 'seconds', 'rows', 'new_periods', 'revisions',
+                                     'error'])
+
+extractors = {'registrations': EVDataExtractor, 'charging_devices': EVCPDataExtractor}
+
+
+def fetch_workbook(source: str, cache_directory: str):
+    '''Returns a local path for a workbook, downloading it into cache_directory when source is a url.'''
+    if not source.startswith(('http://', 'https://')):
+        return source
+    os.makedirs(cache_directory, exist_ok=True)
+    path = os.path.join(cache_directory, source.rsplit('/', 1)[-1])
+    if not os.path.exists(path):
+        urllib.request.urlretrieve(source, path + '.tmp')
+        os.replace(path + '.tmp', path)
+    return path
+
+
+def run_job(job: dict, source: str, sink_url: str, incremental: bool = False, database_path: str = None):
+    '''Extracts one sheet and writes its output. Runs in a worker process.'''
+    start = time.perf_counter()
+    extractor_class = extractors[job['workbook']]
+    extractor = extractor_class(source, sink_url, job['sheet_name'], job['value_name'], job.get('skip_rows'),
+                                job.get('skip_footer'), database_path)
+
+    rows, new_periods, revisions = None, None, None
+    with open_workbook(source, streaming=True, sheet_names=[job['sheet_name']]) as workbook:
+        if extractor_class is EVDataExtractor:
+            if incremental:
+                new_periods, revised = extractor.refresh(job['file_name'], workbook)
+                revisions = len(revised)
+            else:
+                dataframe = extractor.clean_data(workbook)
+                extractor.write_date(dataframe, job['file_name'])
+                rows = len(dataframe)
+        else:
+            if incremental:
+                # Both the totals and the per 100k output, new dates are usually the same in each
+                results = extractor.refresh(job['file_name'], job['file_name_average'], workbook=workbook)
+                new_periods = list(dict.fromkeys(period for periods, _ in results.values() for period in periods))
+                revisions = sum(len(revised) for _, revised in results.values())
+            else:
+                dataframe, dataframe_average = extractor.clean_data(workbook=workbook)
+                extractor.write_date(dataframe, dataframe_average, job['file_name'], job['file_name_average'])
+                rows = len(dataframe) + len(dataframe_average)
+
+    return rows, new_periods, revisions, time.perf_counter() - start
+
+
+def run_manifest(manifest: dict, workers: int = None, incremental: bool = False):
+    '''Runs every job in the manifest across a process pool and returns a JobResult per job.'''
+    sink_url = manifest['sink_url']
+    cache_directory = manifest.get('cache_directory', os.path.join(sink_url, 'source_workbooks'))
+    sources = {name: fetch_workbook(source, cache_directory) for name, source in manifest['workbooks'].items()}
+    database_path = manifest.get('database')
+
+    results = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(run_job, job, sources[job['workbook']], sink_url, incremental, database_path): job
+                   for job in manifest['jobs']}
+        for future in as_completed(futures):
+            job = futures[future]
+            try:
+                rows, new_periods, revisions, seconds = future.result()
+                results.append(JobResult(job['sheet_name'], job['file_name'], seconds, rows, new_periods, revisions,
+                                         None))
+            except Exception:
+                results.append(JobResult(job['sheet_name'], job['file_name'], None, None, None, None,
+                                         traceback.format_exc()))
+
+    return results
+
+
+def print_report(results, wall_seconds: float):
+    print(f'{"sheet":<24}{"output":<44}{"seconds":>9}  result')
+    for result in sorted(results, key=lambda r: r.sheet_name):
+        if result.error:
+            outcome = 'FAILED: ' + result.error.strip().splitlines()[-1]
+        elif result.new_periods is not None:
+            outcome = f'{len(result.new_periods)} new periods, {result.revisions} revised values not applied'
+        else:
+            outcome = f'{result.rows} rows'
+        seconds = '-' if result.seconds is None else f'{result.seconds:.2f}'
+        print(f'{result.sheet_name:<24}{result.file_name:<44}{seconds:>9}  {outcome}')
+    failures = sum(result.error is not None for result in results)
+    print(f'{len(results)} jobs, {failures} failed, {wall_seconds:.2f}s wall time')
+
+
+if __name__ == '__main__':
+    arguments = sys.argv[1:]
+    manifest_path = next((arg for arg in arguments if arg.endswith('.json')),
+                         os.path.join(os.path.dirname(os.path.abspath(__file__)), 'extraction_jobs.json'))
+    workers = int(arguments[arguments.index('--workers') + 1]) if '--workers' in arguments else None
+
+    with open(manifest_path) as file:
+        job_manifest = json.load(file)
+
+    start = time.perf_counter()
+    job_results = run_manifest(job_manifest, workers, '--incremental' in arguments)
+    print_report(job_results, time.perf_counter() - start)
+    sys.exit(1 if any(result.error for result in job_results) else 0)
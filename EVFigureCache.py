@@ -0,0 +1,69 @@
+from collections import OrderedDict
+import threading
+
+import plotly.io as pio
+
+
+class FigureCache:
+
+    '''
+    A least recently used cache of built plotly figures with a memory budget. The size of each figure is taken
+    as the length of its JSON serialisation, which is what Dash sends to the browser and is a close proxy for the
+    memory it holds. When an insert takes the cache over budget the least recently used figures are evicted.
+
+    get_or_build(key, builder) is safe to call from concurrent request threads.
+    '''
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._figures = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._figures)
+
+    def __contains__(self, key):
+        return key in self._figures
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._figures:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._figures.move_to_end(key)
+            return self._figures[key][0]
+
+    def put(self, key, figure):
+        size = len(pio.to_json(figure, validate=False))
+        with self._lock:
+            if key in self._figures:
+                self.current_bytes -= self._figures.pop(key)[1]
+            if size > self.max_bytes:
+                return
+            self._figures[key] = (figure, size)
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                _, (_, evicted_size) = self._figures.popitem(last=False)
+                self.current_bytes -= evicted_size
+
+    def get_or_build(self, key, builder):
+        figure = self.get(key)
+        if figure is None:
+            figure = builder()
+            self.put(key, figure)
+        return figure
+
+    def discard(self, predicate):
+        '''Removes every figure whose key matches predicate, such as those built from superseded data.'''
+        with self._lock:
+            for key in [key for key in self._figures if predicate(key)]:
+                self.current_bytes -= self._figures.pop(key)[1]
+
+    def clear(self):
+        with self._lock:
+            self._figures.clear()
+            self.current_bytes = 0
@@ -0,0 +1,48 @@
+import base64
+
+import dash
+import numpy as np
+import plotly.graph_objects as go
+import plotly.io as pio
+
+# Trace attributes sent as typed arrays when they hold numbers
+typed_array_attributes = ['x', 'y', 'z', 'lat', 'lon', 'customdata']
+
+# The layout part of plotly's default template. Figures carry this rather than the full default template, whose
+# per trace type defaults (mostly colour scales for trace types the dashboard never draws) make up most of its size.
+dashboard_template = go.layout.Template(layout=pio.templates['plotly'].layout)
+
+
+def typed_arrays_supported():
+    '''
+    plotly.js decodes base64 typed arrays ({'dtype', 'bdata'}) from 2.28, which dash_core_components bundles from
+    Dash 2.16. Older versions need plain lists.
+    '''
+    major, minor = (int(part) for part in dash.__version__.split('.')[:2])
+    return (major, minor) >= (2, 16)
+
+
+def typed_array(values):
+    '''Returns a numeric array as a base64 typed array spec, int32 for integers that fit and float64 otherwise.'''
+    values = np.asarray(values)
+    int32 = np.iinfo(np.int32)
+    if values.dtype.kind in 'iub' and (values.size == 0 or int32.min <= values.min() and values.max() <= int32.max):
+        dtype, values = 'i4', values.astype('<i4')
+    else:
+        dtype, values = 'f8', values.astype('<f8')
+    return {'dtype': dtype, 'bdata': base64.b64encode(values.tobytes()).decode('ascii')}
+
+
+def encode_figure(figure, typed_arrays: bool = True):
+    '''
+    Returns a figure as the dict Dash sends to the browser, with every numeric one dimensional trace array encoded
+    as a base64 typed array when typed_arrays is True.
+    '''
+    figure_dict = figure.to_plotly_json() if isinstance(figure, go.Figure) else figure
+    if typed_arrays:
+        for trace in figure_dict.get('data', []):
+            for attribute in typed_array_attributes:
+                values = trace.get(attribute)
+                if isinstance(values, np.ndarray) and values.ndim == 1 and values.dtype.kind in 'iubf':
+                    trace[attribute] = typed_array(values)
+    return figure_dict
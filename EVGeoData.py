@@ -0,0 +1,172 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+# Simplification tolerances in degrees (EPSG:4326), 0.001 degrees being roughly 100m
+boundary_levels = {'full': 0.0, 'high': 0.0002, 'medium': 0.001, 'low': 0.005}
+
+
+def quantise_coordinates(coordinates, precision: int):
+    '''Rounds every position in a (nested) GeoJSON coordinates array to a fixed number of decimal places.'''
+    if isinstance(coordinates[0], (int, float)):
+        return [round(value, precision) for value in coordinates]
+    return [quantise_coordinates(part, precision) for part in coordinates]
+
+
+def file_hash(path: str):
+    sha = hashlib.sha1()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def file_token(path: str):
+    '''Returns a cheap identity token for a file from its size and modification time, without reading it.'''
+    stat = os.stat(path)
+    return f'{stat.st_size:x}-{stat.st_mtime_ns:x}'
+
+
+def level_for_zoom(zoom: float):
+    '''Picks the coarsest boundary level that shows no visible loss at a mapbox zoom level.'''
+    if zoom <= 6:
+        return 'medium'
+    if zoom <= 9:
+        return 'high'
+    return 'full'
+
+
+def simplify_boundaries(geodataframe, tolerance: float):
+    '''
+    Simplifies the boundaries while keeping shared edges shared, so neighbouring districts do not gain gaps or
+    overlaps. This needs coverage_simplify from shapely 2.1+ (see requirements.txt): simplifying each polygon on
+    its own would open slivers along shared edges, so there is deliberately no fallback.
+    '''
+    if tolerance <= 0:
+        return geodataframe
+    from shapely import coverage_simplify
+
+    simplified = geodataframe.copy()
+    simplified['geometry'] = coverage_simplify(geodataframe.geometry.values, tolerance)
+    return simplified
+
+
+def boundary_geojson(geodataframe, id_column: str = 'LAD20CD', name_column: str = 'LAD20NM', precision: int = 4):
+    '''Serialises the id, name and quantised geometry of each boundary to compact GeoJSON bytes.'''
+    features = []
+    for feature in json.loads(geodataframe[[id_column, name_column, 'geometry']].to_json(drop_id=True))['features']:
+        geometry = feature['geometry']
+        geometry['coordinates'] = quantise_coordinates(geometry['coordinates'], precision)
+        features.append({'type': 'Feature', 'properties': feature['properties'], 'geometry': geometry})
+
+    return json.dumps({'type': 'FeatureCollection', 'features': features}, separators=(',', ':')).encode('utf-8')
+
+
+def build_boundary_levels(source_path: str, cache_directory: str, levels: dict = None, precision: int = 4):
+    '''
+    Produces a compact GeoJSON file of the source boundaries for every simplification level and returns
+    {level: path}. Files are cached in cache_directory keyed by a hash of the source file, so the source is only
+    read, reprojected and simplified again when it changes.
+    '''
+    levels = boundary_levels if levels is None else levels
+    source_hash = file_hash(source_path)[:16]
+    paths = {level: os.path.join(cache_directory, f'lad-{source_hash}-{level}.geojson') for level in levels}
+    if all(os.path.exists(path) for path in paths.values()):
+        return paths
+
+    import geopandas
+
+    geodataframe = geopandas.read_file(source_path)
+    geodataframe.to_crs(epsg=4326, inplace=True)
+
+    os.makedirs(cache_directory, exist_ok=True)
+    for level, tolerance in levels.items():
+        content = boundary_geojson(simplify_boundaries(geodataframe, tolerance), precision=precision)
+        temporary_path = paths[level] + '.tmp'
+        with open(temporary_path, 'wb') as file:
+            file.write(content)
+        os.replace(temporary_path, paths[level])
+
+    return paths
+
+
+class BoundaryAsset:
+
+    '''
+    A compact GeoJSON copy of the LAD boundaries sent to the browser once. Map figures reference the asset by url
+    and match features on featureidkey, so map responses only carry the value vector and hover text. The url
+    includes a hash of the content so browsers can cache it indefinitely.
+    '''
+
+    def __init__(self, content: bytes, id_column: str = 'LAD20CD', name_column: str = 'LAD20NM',
+                 url_prefix: str = '/boundaries/'):
+        import pandas as pd
+
+        self.content = content
+        self.featureidkey = f'properties.{id_column}'
+        self.etag = hashlib.sha1(content).hexdigest()[:12]
+        self.url = f'{url_prefix}lad-{self.etag}.geojson'
+
+        properties = [feature['properties'] for feature in json.loads(content)['features']]
+        self.names = pd.Series({feature[id_column]: feature[name_column] for feature in properties})
+
+    @classmethod
+    def from_file(cls, path: str, **kwargs):
+        with open(path, 'rb') as file:
+            return cls(file.read(), **kwargs)
+
+    def response(self):
+        from flask import Response
+
+        return Response(self.content, mimetype='application/geo+json',
+                        headers={'Cache-Control': 'public, max-age=31536000, immutable', 'ETag': self.etag})
+
+    def register(self, server):
+        '''Serves the asset from a Flask server at self.url.'''
+        server.add_url_rule(self.url, 'lad_boundaries', self.response)
+
+
+class DeferredBoundaryAsset:
+
+    '''
+    Stands in for a BoundaryAsset until it is first needed, so the boundary source is not hashed, read or simplified
+    before the server can answer. load() builds the asset once from loader and is safe to call from concurrent
+    request threads or a warm-up thread. If loading fails the next call tries again.
+    '''
+
+    def __init__(self, loader, url_prefix: str = '/boundaries/'):
+        self.url_prefix = url_prefix
+        self.load_seconds = None
+        self._loader = loader
+        self._asset = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        return self._asset is not None
+
+    def load(self):
+        if self._asset is None:
+            with self._lock:
+                if self._asset is None:
+                    start = time.perf_counter()
+                    self._asset = self._loader()
+                    self.load_seconds = time.perf_counter() - start
+        return self._asset
+
+    def register(self, server):
+        '''
+        Serves the asset from a Flask server under url_prefix. The content hashed url is only known once the asset
+        is loaded, so the route matches any file name and answers 404 for all but the current one.
+        '''
+        from flask import abort
+
+        def serve_boundaries(file_name):
+            asset = self.load()
+            if self.url_prefix + file_name != asset.url:
+                abort(404)
+            return asset.response()
+
+        server.add_url_rule(self.url_prefix + '<file_name>', 'lad_boundaries', serve_boundaries)
@@ -0,0 +1,208 @@
+import bisect
+import functools
+import json
+import logging
+import threading
+import time
+
+latency_buckets = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+byte_buckets = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+logger = logging.getLogger('ev_dashboard.metrics')
+
+
+def _enable_logging():
+    '''Lets the INFO request lines through, which the default WARNING level and lack of a handler would drop.'''
+    if logger.level == logging.NOTSET:
+        logger.setLevel(logging.INFO)
+    if not logger.hasHandlers():
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        logger.addHandler(handler)
+
+
+class Histogram:
+
+    '''A Prometheus style histogram: cumulative bucket counts are worked out when rendered.'''
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self, name: str, labels: str):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_sum{{{labels}}} {self.sum}')
+        lines.append(f'{name}_count{{{labels}}} {self.count}')
+        return lines
+
+
+class _NoStage:
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_no_stage = _NoStage()
+
+
+class _Stage:
+
+    __slots__ = ('metrics', 'name', 'start')
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        stages = getattr(self.metrics._local, 'stages', None)
+        if stages is not None:
+            stages[self.name] = stages.get(self.name, 0) + time.perf_counter() - self.start
+        return False
+
+
+class CallbackMetrics:
+
+    '''
+    Per callback latency and payload metrics for the dashboard, rendered in the Prometheus text format.
+
+    Each server side callback request is timed as a whole and split into stages: 'data' and 'figure' as marked
+    with stage() inside the callback, 'callback' for the whole callback function as marked by timed(), and
+    'serialise' for the remainder spent by Dash encoding the response. The size of each JSON response is recorded
+    too. collect() adds values read when the metrics are rendered, such as cache hit counts and start up timings.
+    With log set, every request is also written to the 'ev_dashboard.metrics' logger as a line of json. The logger
+    is set to INFO, and when no handler would receive its records one writing the bare lines to stderr is attached.
+
+    A disabled instance leaves the callbacks unwrapped and stage() returns a shared no-op, so instrumentation costs
+    nothing when it is off. Metrics are held per process.
+    '''
+
+    def __init__(self, enabled: bool = True, log: bool = False, prefix: str = 'ev_dashboard'):
+        self.enabled = enabled
+        self.log = log
+        self.prefix = prefix
+        self.latency = {}
+        self.response_bytes = {}
+        self.collected = {}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        if log:
+            _enable_logging()
+
+    def stage(self, name: str):
+        '''Times a block of the current callback, use as: with metrics.stage('data'): ...'''
+        if not self.enabled:
+            return _no_stage
+        return _Stage(self, name)
+
+    def timed(self, callback):
+        '''Decorates a Dash callback so its own run time is told apart from Dash's. Place it under @app.callback.'''
+        if not self.enabled:
+            return callback
+
+        @functools.wraps(callback)
+        def wrapper(*args, **kwargs):
+            with self.stage('callback'):
+                return callback(*args, **kwargs)
+
+        return wrapper
+
+    def instrument(self, app):
+        '''Wraps every server side callback registered on a Dash app so its requests are recorded.'''
+        if not self.enabled:
+            return
+        for entry in app.callback_map.values():
+            if 'callback' in entry:
+                name = getattr(entry['callback'], '__name__', 'callback')
+                entry['callback'] = self._record_requests(name, entry['callback'])
+
+    def _record_requests(self, name: str, dispatch):
+        @functools.wraps(dispatch)
+        def wrapper(*args, **kwargs):
+            self._local.stages = stages = {}
+            start = time.perf_counter()
+            try:
+                response = dispatch(*args, **kwargs)
+            finally:
+                self._local.stages = None
+            stages['total'] = time.perf_counter() - start
+            if 'callback' in stages:
+                stages['serialise'] = stages['total'] - stages['callback']
+            self.observe(name, stages, len(response))
+            return response
+
+        return wrapper
+
+    def observe(self, callback_name: str, stages: dict, response_bytes: int):
+        with self._lock:
+            for stage_name, seconds in stages.items():
+                key = (callback_name, stage_name)
+                if key not in self.latency:
+                    self.latency[key] = Histogram(latency_buckets)
+                self.latency[key].observe(seconds)
+            if callback_name not in self.response_bytes:
+                self.response_bytes[callback_name] = Histogram(byte_buckets)
+            self.response_bytes[callback_name].observe(response_bytes)
+        if self.log:
+            logger.info(json.dumps({'callback': callback_name, 'bytes': response_bytes,
+                                    **{f'{stage_name}_seconds': round(seconds, 6)
+                                       for stage_name, seconds in stages.items()}}))
+
+    def collect(self, name: str, help_text: str, read, label: str = None, kind: str = 'gauge'):
+        '''
+        Adds a metric read when the metrics are rendered. read() returns a number, or {label value: number} when
+        label is given. Values of None, such as timings of steps that have not run yet, are left out.
+        '''
+        self.collected[name] = (help_text, read, label, kind)
+
+    def render(self):
+        '''Returns every metric in the Prometheus text exposition format.'''
+        lines = []
+        with self._lock:
+            name = f'{self.prefix}_callback_seconds'
+            lines += [f'# HELP {name} Callback request latency by stage.', f'# TYPE {name} histogram']
+            for (callback_name, stage_name), histogram in sorted(self.latency.items()):
+                lines += histogram.render(name, f'callback="{callback_name}",stage="{stage_name}"')
+
+            name = f'{self.prefix}_callback_response_bytes'
+            lines += [f'# HELP {name} Size of callback JSON responses before compression.', f'# TYPE {name} histogram']
+            for callback_name, histogram in sorted(self.response_bytes.items()):
+                lines += histogram.render(name, f'callback="{callback_name}"')
+
+        for metric_name, (help_text, read, label, kind) in self.collected.items():
+            name = f'{self.prefix}_{metric_name}'
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}']
+            values = read()
+            if label is None:
+                values = {None: values}
+            for label_value, value in values.items():
+                if value is not None:
+                    lines.append(f'{name}{{{label}="{label_value}"}} {value}' if label else f'{name} {value}')
+        return '\n'.join(lines) + '\n'
+
+    def register(self, server, path: str = '/metrics'):
+        '''Serves render() from a Flask server.'''
+        if not self.enabled:
+            return
+
+        def serve_metrics():
+            return self.render(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
+        server.add_url_rule(path, 'ev_dashboard_metrics', serve_metrics)
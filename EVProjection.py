@@ -0,0 +1,136 @@
+from collections import namedtuple
+from datetime import datetime
+import threading
+
+import numpy as np
+import pandas as pd
+
+from EVDataStore import encode_series_store, parse_period
+
+# Projected values of every region with data for a metric, rows as in the data store's metric_cube. exponential
+# flags the regions whose trend was fitted on the log scale.
+Projection = namedtuple('Projection', ['periods', 'regions', 'values', 'present', 'exponential'])
+
+
+def period_months(periods):
+    '''Returns the month number of each period label, so trends are fitted against real time between periods.'''
+    return np.array([date.year * 12 + date.month - 1 for date in map(parse_period, periods)], dtype=np.float64)
+
+
+def future_periods(periods, count: int):
+    '''Returns the labels of the count periods after the last one, stepping by the spacing of the last two.'''
+    months = period_months(periods[-2:])
+    step = int(months[-1] - months[0]) if len(months) > 1 else 3
+    labels = []
+    for i in range(1, count + 1):
+        month = int(months[-1]) + step * i
+        date = datetime(month // 12, month % 12 + 1, 1)
+        labels.append(f'{date.year} Q{(date.month - 1) // 3 + 1}' if ' Q' in periods[-1] else date.strftime('%b-%y'))
+    return labels
+
+
+def fit_trends(times, values, weights):
+    '''
+    Fits values = intercept + slope * times for every row of a (region x period) matrix at once, by weighted least
+    squares in closed form from the weighted sums. Rows with fewer than two weighted points get NaN.
+    '''
+    s0 = weights.sum(axis=1)
+    st = weights @ times
+    stt = weights @ (times * times)
+    sy = (weights * values).sum(axis=1)
+    sty = (weights * values) @ times
+
+    denominator = s0 * stt - st * st
+    with np.errstate(divide='ignore', invalid='ignore'):
+        slope = np.where(denominator > 0, (s0 * sty - st * sy) / denominator, np.nan)
+        intercept = (sy - slope * st) / s0
+    return intercept, slope
+
+
+def project_trends(times, values, present, future_times):
+    '''
+    Projects every row of a (region x period) matrix to future_times with a linear and an exponential (log linear)
+    trend fitted over the present cells, keeping for each region whichever fits its own data more closely.
+    Returns the projected (region x future period) values, rows with a projection and the exponential choice.
+    '''
+    weights = present.astype(np.float64)
+    values = values.astype(np.float64)
+    # Times are taken from the last fitted period so the intercepts stay well conditioned
+    origin = times[-1]
+    times, future_times = times - origin, future_times - origin
+
+    linear_intercept, linear_slope = fit_trends(times, values, weights)
+    log_intercept, log_slope = fit_trends(times, np.log1p(values), weights)
+
+    def evaluate(intercept, slope, at):
+        return intercept[:, None] + slope[:, None] * at[None, :]
+
+    linear_error = (weights * (evaluate(linear_intercept, linear_slope, times) - values) ** 2).sum(axis=1)
+    exponential_fit = np.expm1(evaluate(log_intercept, log_slope, times))
+    exponential_error = (weights * (exponential_fit - values) ** 2).sum(axis=1)
+    exponential = exponential_error < linear_error
+
+    with np.errstate(over='ignore'):
+        projected = np.where(exponential[:, None], np.expm1(evaluate(log_intercept, log_slope, future_times)),
+                             evaluate(linear_intercept, linear_slope, future_times))
+    has_projection = np.isfinite(linear_slope) & np.isfinite(projected).all(axis=1)
+    projected = np.where(has_projection[:, None], np.maximum(projected, 0), 0)
+    return projected, has_projection, exponential & has_projection
+
+
+class ProjectionEngine:
+
+    '''
+    Projects every metric of a data store forward horizon periods, fitting each region's trend over its last
+    fit_periods periods. All regions of a metric are fitted together as one batch of least squares problems, so
+    a metric is projected in milliseconds. Projections are computed once per metric on first use and kept with the
+    data store they were fitted to, so they are cached for exactly as long as that data version is served.
+    '''
+
+    def __init__(self, data_store, fit_periods: int = 8, horizon: int = 8):
+        self.data_store = data_store
+        self.fit_periods = fit_periods
+        self.horizon = horizon
+        self._projections = {}
+        self._lock = threading.Lock()
+
+    def projection(self, metric_name: str):
+        if metric_name not in self._projections:
+            with self._lock:
+                if metric_name not in self._projections:
+                    self._projections[metric_name] = self._project(metric_name)
+        return self._projections[metric_name]
+
+    def _project(self, metric_name: str):
+        periods = self.data_store.metrics[metric_name].timeline.periods
+        regions, values, present = self.data_store.metric_cube(metric_name)
+        window = slice(max(len(periods) - self.fit_periods, 0), len(periods))
+        labels = future_periods(periods, self.horizon)
+
+        projected, has_projection, exponential = project_trends(
+            period_months(periods[window]), values[:, window], present[:, window], period_months(labels))
+        return Projection(labels, regions, projected, has_projection, exponential)
+
+    def series_store(self, metric_name: str):
+        '''
+        Returns the projected values in the encoding of the data store's series_store, for the line chart overlay.
+        Rows match the regions of the metric's series_store, so they are not repeated.
+        '''
+        projection = self.projection(metric_name)
+        store = encode_series_store(projection.periods, [], np.rint(projection.values), projection.present)
+        del store['regions']
+        return store
+
+    def period_frame(self, metric_name: str, position: int = -1):
+        '''
+        Returns the code, name and projected value of every region at a projected period, by default the end of the
+        horizon, in the form of the data store's period_frame used by the map.
+        '''
+        projection = self.projection(metric_name)
+        frame = self.data_store.period_frame(metric_name, self.data_store.metrics[metric_name].timeline.latest)
+        projected = pd.Series(projection.values[projection.present, position],
+                              index=np.asarray(projection.regions)[projection.present])
+        values = projected.reindex(frame[frame.columns[1]]).to_numpy()
+        frame = frame.loc[~np.isnan(values)].copy()
+        frame[frame.columns[2]] = np.rint(values[~np.isnan(values)]).astype(np.int64)
+        return frame
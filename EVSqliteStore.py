@@ -0,0 +1,215 @@
+from collections import namedtuple
+import hashlib
+import os
+import sqlite3
+import sys
+import threading
+import uuid
+
+import numpy as np
+import pandas as pd
+
+from EVDataStore import Timeline, compute_change_statistics, encode_series_store, parse_period
+
+schema = '''
+CREATE TABLE IF NOT EXISTS regions (
+    region_id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    code TEXT NOT NULL DEFAULT ''
+);
+CREATE TABLE IF NOT EXISTS periods (
+    period_id INTEGER PRIMARY KEY,
+    label TEXT NOT NULL UNIQUE,
+    start_date TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS metrics (
+    metric_id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    value_column TEXT NOT NULL,
+    revision TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS metric_values (
+    metric_id INTEGER NOT NULL REFERENCES metrics,
+    region_id INTEGER NOT NULL REFERENCES regions,
+    period_id INTEGER NOT NULL REFERENCES periods,
+    value INTEGER NOT NULL,
+    PRIMARY KEY (metric_id, region_id, period_id)
+) WITHOUT ROWID;
+-- Covering index for the map, which reads one period of a metric
+CREATE INDEX IF NOT EXISTS metric_values_by_period ON metric_values (metric_id, period_id, region_id, value);
+'''
+
+
+def connect(database_path: str, read_only: bool = False):
+    if read_only:
+        connection = sqlite3.connect(f'file:{database_path}?mode=ro', uri=True, timeout=60)
+    else:
+        connection = sqlite3.connect(database_path, timeout=60)
+        # Readers are not blocked while an extractor writes
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.executescript(schema)
+    return connection
+
+
+def write_table(database_path: str, metric_name: str, table):
+    '''
+    Replaces every value of a metric with the rows of a ColumnarTable in a single transaction. Rows repeating a
+    (region, period) pair, such as the per-region 'Local Authority Unknown' rows, are summed.
+    '''
+    frame = pd.DataFrame({'region': table.region_index, 'period': table.period_index, 'value': table.values})
+    frame = frame.groupby(['region', 'period'], sort=False, as_index=False)['value'].sum()
+
+    connection = connect(database_path)
+    try:
+        with connection:
+            connection.executemany('INSERT OR IGNORE INTO regions (name, code) VALUES (?, ?)',
+                                   zip(table.region_names, table.region_codes))
+            connection.executemany("UPDATE regions SET code = ? WHERE name = ? AND code = ''",
+                                   [(code, name) for name, code in zip(table.region_names, table.region_codes) if code])
+            connection.executemany('INSERT OR IGNORE INTO periods (label, start_date) VALUES (?, ?)',
+                                   [(period, parse_period(period).date().isoformat()) for period in table.periods])
+            connection.execute('INSERT INTO metrics (name, value_column, revision) VALUES (?, ?, ?) '
+                               'ON CONFLICT (name) DO UPDATE SET value_column = excluded.value_column, '
+                               'revision = excluded.revision',
+                               (metric_name, table.value_column, uuid.uuid4().hex))
+
+            region_ids = dict(connection.execute('SELECT name, region_id FROM regions'))
+            period_ids = dict(connection.execute('SELECT label, period_id FROM periods'))
+            metric_id = connection.execute('SELECT metric_id FROM metrics WHERE name = ?', (metric_name,)).fetchone()[0]
+            region_id = np.array([region_ids[name] for name in table.region_names], dtype=np.int64)
+            period_id = np.array([period_ids[period] for period in table.periods], dtype=np.int64)
+
+            connection.execute('DELETE FROM metric_values WHERE metric_id = ?', (metric_id,))
+            connection.executemany('INSERT INTO metric_values (metric_id, region_id, period_id, value) VALUES (?, ?, ?, ?)',
+                                   zip([metric_id] * len(frame), region_id[frame['region']].tolist(),
+                                       period_id[frame['period']].tolist(), frame['value'].tolist()))
+        connection.execute('PRAGMA optimize')
+    finally:
+        connection.close()
+
+
+def metric_revisions(database_path: str):
+    '''Returns {metric name: revision}, each revision changing whenever write_table replaces that metric.'''
+    connection = connect(database_path, read_only=True)
+    try:
+        return dict(connection.execute('SELECT name, revision FROM metrics'))
+    finally:
+        connection.close()
+
+
+SqlMetric = namedtuple('SqlMetric', ['name', 'table_name', 'value_column', 'timeline'])
+
+
+class SqlDataStore:
+
+    '''
+    Answers the dashboard's chart, map and stamp queries from the SQLite database written by the extractors rather
+    than holding every metric in memory. Only the timelines and the region names are kept; each callback runs an
+    indexed query, so adding datasets grows the database rather than the memory of every worker.
+
+    Metrics are given as {metric name: (table name in the database, value column, timeline name)}. Each thread
+    and each forked worker opens its own read only connection.
+    '''
+
+    header_names = ['LA/RegionCode', 'LA/RegionName']
+
+    def __init__(self, database_path: str, sources: dict):
+        self.database_path = database_path
+        self._local = threading.local()
+
+        table_names = [table_name for table_name, _, _ in sources.values()]
+        placeholders = ','.join('?' * len(table_names))
+        metric_rows = self._query(f'SELECT name, metric_id, revision FROM metrics WHERE name IN ({placeholders})',
+                                  table_names)
+        metric_ids = {name: metric_id for name, metric_id, _ in metric_rows}
+        missing = set(table_names) - set(metric_ids)
+        if missing:
+            raise ValueError(f'metrics {sorted(missing)} not found in {database_path}')
+
+        timeline_periods = {}
+        for table_name, _, timeline_name in sources.values():
+            periods = self._query('SELECT DISTINCT p.label FROM metric_values v JOIN periods p USING (period_id) '
+                                  'WHERE v.metric_id = ?', (metric_ids[table_name],))
+            timeline_periods.setdefault(timeline_name, set()).update(period for period, in periods)
+        self.timelines = {name: Timeline(periods) for name, periods in timeline_periods.items()}
+
+        self.period_ids = dict(self._query('SELECT label, period_id FROM periods'))
+        self.metrics = {metric_name: SqlMetric(metric_name, table_name, value_column, self.timelines[timeline_name])
+                        for metric_name, (table_name, value_column, timeline_name) in sources.items()}
+        self._metric_ids = {metric_name: metric_ids[table_name]
+                            for metric_name, (table_name, _, _) in sources.items()}
+
+        revisions = '|'.join(f'{name}={revision}' for name, _, revision in sorted(metric_rows))
+        self.version = hashlib.sha1(revisions.encode('utf-8')).hexdigest()[:16]
+
+    def _connection(self):
+        # A connection opened before a fork must not be used by the child
+        if getattr(self._local, 'pid', None) != os.getpid():
+            self._local.connection = connect(self.database_path, read_only=True)
+            self._local.pid = os.getpid()
+        return self._local.connection
+
+    def _query(self, sql: str, parameters=()):
+        return self._connection().execute(sql, parameters).fetchall()
+
+    def memory_usage(self):
+        '''Returns the bytes held for the period ids, the metrics themselves stay in the database.'''
+        return {'periods': sum(sys.getsizeof(period) for period in self.period_ids)}
+
+    def region_names(self, metric_name: str):
+        rows = self._query('SELECT r.name FROM regions r WHERE EXISTS (SELECT 1 FROM metric_values v '
+                           'WHERE v.metric_id = ? AND v.region_id = r.region_id) ORDER BY r.region_id',
+                           (self._metric_ids[metric_name],))
+        return [name for name, in rows]
+
+    def codes_for(self, regions):
+        '''Returns the region code of each region name, '' for names without one.'''
+        codes = dict(self._query('SELECT name, code FROM regions'))
+        return np.array([codes.get(name, '') for name in regions], dtype=object)
+
+    def metric_cube(self, metric_name: str):
+        '''Returns the regions with data for a metric and their (region x period) values and present mask.'''
+        metric = self.metrics[metric_name]
+        rows = np.array(self._query('SELECT region_id, period_id, value FROM metric_values WHERE metric_id = ?',
+                                    (self._metric_ids[metric_name],)), dtype=np.int64).reshape(-1, 3)
+        region_ids, row_index = np.unique(rows[:, 0], return_inverse=True)
+        period_columns = {self.period_ids[period]: column for column, period in enumerate(metric.timeline.periods)}
+        column_index = np.array([period_columns[period_id] for period_id in rows[:, 1]], dtype=np.int64)
+        names = dict(self._query('SELECT region_id, name FROM regions'))
+        regions = np.array([names[region_id] for region_id in region_ids.tolist()], dtype=object)
+
+        cube = np.zeros((len(regions), len(metric.timeline)), dtype=np.int64)
+        present = np.zeros(cube.shape, dtype=bool)
+        cube[row_index, column_index] = rows[:, 2]
+        present[row_index, column_index] = True
+        return regions, cube, present
+
+    def series_store(self, metric_name: str):
+        '''Returns the series of every region with data for a metric, see encode_series_store.'''
+        return encode_series_store(self.metrics[metric_name].timeline.periods, *self.metric_cube(metric_name))
+
+    def change_statistics(self, metric_name: str, locations: list, start: int, end: int):
+        '''Returns the ChangeStatistics of every location between two slider positions.'''
+        periods = self.metrics[metric_name].timeline.periods
+        start_id, end_id = self.period_ids[periods[start]], self.period_ids[periods[end]]
+        placeholders = ','.join('?' * len(locations))
+        rows = self._query(f'SELECT r.name, v.period_id, v.value FROM metric_values v JOIN regions r USING (region_id) '
+                           f'WHERE v.metric_id = ? AND v.period_id IN (?, ?) AND r.name IN ({placeholders})',
+                           [self._metric_ids[metric_name], start_id, end_id, *locations])
+        values = {(name, period_id): value for name, period_id, value in rows}
+
+        present = np.array([(location, start_id) in values and (location, end_id) in values
+                            for location in locations], dtype=bool)
+        return compute_change_statistics([values.get((location, start_id), 0) for location in locations],
+                                         [values.get((location, end_id), 0) for location in locations], present)
+
+    def period_frame(self, metric_name: str, period: str):
+        '''
+        Returns the code, name and value of every region with data for one period, as used by the map. The frame is
+        empty for an unknown period, such as None from a cleared date dropdown.
+        '''
+        metric = self.metrics[metric_name]
+        rows = self._query("SELECT r.code, r.name, v.value FROM metric_values v JOIN regions r USING (region_id) "
+                           "WHERE v.metric_id = ? AND v.period_id = ? AND r.code != '' ORDER BY v.region_id",
+                           (self._metric_ids[metric_name], self.period_ids.get(period)))
+        return pd.DataFrame(rows, columns=self.header_names + [metric.value_column])
@@ -0,0 +1,194 @@
+from collections import namedtuple
+import io
+import urllib.request
+import xml.etree.ElementTree as ElementTree
+import zipfile
+
+import numpy as np
+import pandas as pd
+from pandas.io.parsers import TextParser
+
+# One sheet to extract from a workbook. skip_rows and skip_footer default to the extractor's class values.
+SheetSpec = namedtuple('SheetSpec', ['sheet_name', 'value_name', 'skip_rows', 'skip_footer'], defaults=(None, None))
+
+OFFICE_NS = '{urn:oasis:names:tc:opendocument:xmlns:office:1.0}'
+TABLE_NS = '{urn:oasis:names:tc:opendocument:xmlns:table:1.0}'
+TEXT_NS = '{urn:oasis:names:tc:opendocument:xmlns:text:1.0}'
+
+TABLE = TABLE_NS + 'table'
+TABLE_ROW = TABLE_NS + 'table-row'
+TABLE_CELL = TABLE_NS + 'table-cell'
+COVERED_TABLE_CELL = TABLE_NS + 'covered-table-cell'
+TEXT_S = TEXT_NS + 's'
+
+
+def open_workbook(source_url: str, streaming: bool = False, sheet_names: list = None):
+    '''
+    Downloads and parses an ODS workbook once. The returned workbook can be passed to the extractors' clean_data
+    so every sheet is read from the same source. By default this is a pd.ExcelFile holding the full document,
+    with streaming=True it is a StreamingWorkbook that only reads sheet_names.
+    '''
+    if streaming:
+        return StreamingWorkbook(source_url, sheet_names)
+    return pd.ExcelFile(source_url, engine='odf')
+
+
+def read_sheet(source, sheet_name: str, skip_rows: int, skip_footer: int, names: list = None):
+    '''
+    Reads one sheet the way pd.read_excel does, from a source url, a parsed pd.ExcelFile or a StreamingWorkbook.
+    '''
+    if isinstance(source, StreamingWorkbook):
+        return source.parse(sheet_name, skip_rows, skip_footer, names)
+    return pd.read_excel(source, sheet_name=sheet_name, skiprows=skip_rows, skipfooter=skip_footer, names=names)
+
+
+def _string_value(element):
+    # Text of a cell, expanding the run length encoded spaces in <text:s text:c="n"/>
+    value = [element.text.strip('\n')] if element.text else []
+    for child in element:
+        if child.tag == TEXT_S:
+            value.append(' ' * int(child.get(TEXT_NS + 'c', 1)))
+        else:
+            value.append(_string_value(child))
+        if child.tail:
+            value.append(child.tail.strip('\n'))
+    return ''.join(value)
+
+
+def _cell_value(cell):
+    # Mirrors pandas' ODFReader so parsed sheets match pd.read_excel exactly
+    text = ''.join(cell.itertext())
+    if text == '#N/A':
+        return np.nan
+
+    cell_type = cell.get(OFFICE_NS + 'value-type')
+    if cell_type is None:
+        return ''
+    if cell_type == 'boolean':
+        return text == 'TRUE'
+    if cell_type == 'float':
+        value = float(cell.get(OFFICE_NS + 'value'))
+        return int(value) if int(value) == value else value
+    if cell_type in ('percentage', 'currency'):
+        return float(cell.get(OFFICE_NS + 'value'))
+    if cell_type == 'string':
+        return _string_value(cell)
+    if cell_type == 'date':
+        return pd.to_datetime(cell.get(OFFICE_NS + 'date-value'))
+    if cell_type == 'time':
+        return pd.to_datetime(text).time()
+    raise ValueError(f'Unrecognized type {cell_type}')
+
+
+class StreamingWorkbook:
+
+    '''
+    Reads sheets of an ODS workbook by streaming content.xml with iterparse rather than building a DOM of the whole
+    document as the pandas odf engine does. Rows of sheets that were not asked for are discarded as they are read,
+    each row is released once its values are taken, and the parse stops as soon as the last wanted sheet ends.
+
+    Repeated rows and cells (number-rows-repeated / number-columns-repeated) are expanded only when content follows
+    them, so the padding many workbooks carry to the edge of the sheet is never materialised. Parsed grids go
+    through the same TextParser as pd.read_excel, so skip_rows / skip_footer / names behave identically.
+    '''
+
+    def __init__(self, source_url: str, sheet_names: list = None):
+        self.source_url = source_url
+        self.sheet_names = list(sheet_names or [])
+        self._sheets = {}
+
+        if source_url.startswith(('http://', 'https://')):
+            with urllib.request.urlopen(source_url) as response:
+                source = io.BytesIO(response.read())
+        else:
+            source = source_url
+        self._archive = zipfile.ZipFile(source)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self._archive.close()
+
+    def parse(self, sheet_name: str, skip_rows: int = None, skip_footer: int = 0, names: list = None):
+        if sheet_name not in self._sheets:
+            wanted = {sheet_name} | {name for name in self.sheet_names if name not in self._sheets}
+            self._sheets.update(self.read_grids(wanted))
+        if sheet_name not in self._sheets:
+            raise ValueError(f'sheet {sheet_name} not found')
+
+        data = self._sheets.pop(sheet_name)
+        if not data:
+            return pd.DataFrame()
+        return TextParser(data, names=names, header=0, skiprows=skip_rows, skipfooter=skip_footer,
+                          skip_blank_lines=False).read()
+
+    def read_grids(self, sheet_names):
+        '''Returns {sheet name: square list of row values} for the wanted sheets in one pass over content.xml.'''
+        remaining = set(sheet_names)
+        grids = {}
+        table, grid, empty_rows, max_row_len = None, None, 0, 0
+
+        with self._archive.open('content.xml') as content:
+            for event, element in ElementTree.iterparse(content, events=('start', 'end')):
+                if event == 'start':
+                    if element.tag == TABLE:
+                        name = element.get(TABLE_NS + 'name')
+                        table = name if name in remaining else None
+                        grid, empty_rows, max_row_len = [], 0, 0
+                    continue
+
+                if element.tag == TABLE_ROW and table is not None:
+                    row, empty_cells = [], 0
+                    for cell in element:
+                        if cell.tag not in (TABLE_CELL, COVERED_TABLE_CELL):
+                            continue
+                        value = _cell_value(cell) if cell.tag == TABLE_CELL else ''
+                        repeat = int(cell.get(TABLE_NS + 'number-columns-repeated', 1))
+                        if isinstance(value, str) and value == '':
+                            empty_cells += repeat
+                        else:
+                            row.extend([''] * empty_cells)
+                            empty_cells = 0
+                            row.extend([value] * repeat)
+                    max_row_len = max(max_row_len, len(row))
+
+                    row_repeat = int(element.get(TABLE_NS + 'number-rows-repeated', 1))
+                    if all(len(cell) == 0 for cell in element):
+                        empty_rows += row_repeat
+                    else:
+                        grid.extend([['']] * empty_rows)
+                        empty_rows = 0
+                        grid.extend([row] * row_repeat)
+                    element.clear()
+
+                elif element.tag == TABLE_ROW:
+                    element.clear()
+
+                elif element.tag == TABLE:
+                    if table is not None:
+                        grids[table] = [row + [''] * (max_row_len - len(row)) for row in grid]
+                        remaining.discard(table)
+                    table = None
+                    element.clear()
+                    if not remaining:
+                        break
+
+        return grids
+
+
+if __name__ == '__main__':
+    # Verifies the streaming reader against pd.read_excel for every sheet of a local workbook:
+    # python EVWorkbook.py <workbook.ods> [skip rows] [skip footer]
+    import sys
+
+    path = sys.argv[1]
+    skip_rows, skip_footer = (int(arg) for arg in (sys.argv[2:4] + ['0', '0'])[:2])
+    expected = pd.read_excel(path, sheet_name=None, skiprows=skip_rows, skipfooter=skip_footer, engine='odf')
+    with open_workbook(path, streaming=True, sheet_names=list(expected)) as workbook:
+        for sheet_name, expected_df in expected.items():
+            pd.testing.assert_frame_equal(workbook.parse(sheet_name, skip_rows, skip_footer), expected_df)
+            print(f'{sheet_name}: {expected_df.shape} matches read_excel')
@@ -0,0 +1,84 @@
+/*
+ * Clientside line charts. The server sends every region's series for the selected metric once (see
+ * EVDataStore.series_store), and the date sliders and location dropdown are applied here without a server round trip.
+ * The projected trend of each location (EVProjection.ProjectionEngine.series_store) is drawn dotted after its series
+ * when the projection toggle is on.
+ */
+(function () {
+    const decoded = new WeakMap();
+    // Fixed so each projection can share its location's colour
+    const colorway = ['#636efa', '#EF553B', '#00cc96', '#ab63fa', '#FFA15A', '#19d3f3', '#FF6692', '#B6E880',
+                      '#FF97FF', '#FECB52'];
+
+    function decodeArray(encoded, ArrayType) {
+        const binary = atob(encoded);
+        const bytes = new Uint8Array(binary.length);
+        for (let i = 0; i < binary.length; i++) {
+            bytes[i] = binary.charCodeAt(i);
+        }
+        return new ArrayType(bytes.buffer);
+    }
+
+    function decodeStore(store) {
+        if (!decoded.has(store)) {
+            const rows = {};
+            store.regions.forEach(function (region, i) { rows[region] = i; });
+            const projection = store.projection;
+            decoded.set(store, {
+                rows: rows,
+                values: decodeArray(store.values, store.dtype === 'int32' ? Int32Array : Float64Array),
+                present: decodeArray(store.present, Uint8Array),
+                projection: projection && {
+                    values: decodeArray(projection.values, projection.dtype === 'int32' ? Int32Array : Float64Array),
+                    present: decodeArray(projection.present, Uint8Array)
+                }
+            });
+        }
+        return decoded.get(store);
+    }
+
+    window.dash_clientside = Object.assign({}, window.dash_clientside, {
+        ev_charts: {
+            filter_series: function (store, locations, range, projection_toggle) {
+                if (!store) {
+                    return window.dash_clientside.no_update;
+                }
+                const series = decodeStore(store);
+                const periodCount = store.periods.length;
+                const showProjection = series.projection && (projection_toggle || []).indexOf('show') !== -1;
+                const traces = [];
+                (locations || []).forEach(function (location, index) {
+                    const x = [];
+                    const y = [];
+                    const color = colorway[index % colorway.length];
+                    const row = series.rows[location];
+                    if (row !== undefined) {
+                        for (let column = range[0]; column <= range[1]; column++) {
+                            const cell = row * periodCount + column;
+                            if (series.present[cell]) {
+                                x.push(store.periods[column]);
+                                y.push(series.values[cell]);
+                            }
+                        }
+                    }
+                    traces.push({type: 'scatter', x: x, y: y, name: location, legendgroup: location,
+                                 line: {width: 5, color: color}});
+
+                    if (showProjection && row !== undefined && series.projection.present[row]) {
+                        const horizon = store.projection.periods.length;
+                        // Joined to the last actual point when the slider reaches the end of the series
+                        const px = range[1] === periodCount - 1 && x.length ? [x[x.length - 1]] : [];
+                        const py = px.length ? [y[y.length - 1]] : [];
+                        for (let column = 0; column < horizon; column++) {
+                            px.push(store.projection.periods[column]);
+                            py.push(series.projection.values[row * horizon + column]);
+                        }
+                        traces.push({type: 'scatter', x: px, y: py, name: location + ' (projected)',
+                                     legendgroup: location, line: {width: 3, color: color, dash: 'dot'}});
+                    }
+                });
+                return {data: traces, layout: store.layout};
+            }
+        }
+    });
+})();
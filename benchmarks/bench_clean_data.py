@@ -0,0 +1,132 @@
+'''
+Times the vectorised EVDataExtractor.clean_frame and EVCPDataExtractor.clean_frame against the previous
+apply/melt based cleaning as the number of periods grows. Both are fed the same synthetic sheet, shaped like
+the frame read from the DfT workbooks, and their outputs are checked to be identical.
+
+Run from the repository root:
+    python benchmarks/bench_clean_data.py [regions] [repeats]
+'''
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from EVDataExtractorChargingDevices import EVCPDataExtractor
+from EVDataExtractorRegistrations import EVDataExtractor
+
+
+def quarter_labels(periods):
+    return [f'{2021 - i // 4} Q{4 - i % 4}' for i in range(periods)]
+
+
+def month_labels(periods):
+    months = ['Jan', 'Oct', 'Jul', 'Apr']
+    return [f'{months[i % 4]}-{(22 - (i + 3) // 4) % 100:02d}' for i in range(periods)]
+
+
+def region_columns(regions):
+    codes = [f'E{i:08d}' for i in range(regions)]
+    names = [f'  {"district" if i % 2 else "DISTRICT"} {i} and borough ' for i in range(regions)]
+    return codes, names
+
+
+def registrations_sheet(regions, periods, rng):
+    codes, names = region_columns(regions)
+    values = rng.integers(0, 50000, size=(regions, periods)).astype(object)
+    values[rng.random((regions, periods)) < 0.05] = 'c'
+    df = pd.DataFrame(values, columns=quarter_labels(periods))
+    df.insert(0, 'Region/Local Authority (Apr-2019)', names)
+    df.insert(0, 'ONS LA Code (April-2019)', codes)
+    return df
+
+
+def charging_sheet(extractor, dates, regions, rng):
+    codes, names = region_columns(regions)
+    columns = []
+    for date in dates:
+        columns += [extractor.value_name + date, extractor.value_name_average + date]
+    values = np.empty((regions, len(columns)), dtype=object)
+    values[:, 0::2] = rng.integers(0, 5000, size=(regions, len(dates)))
+    values[:, 1::2] = rng.integers(0, 900, size=(regions, len(dates))) / 10
+    values[rng.random(values.shape) < 0.05] = '-'
+    df = pd.DataFrame(values, columns=columns)
+    df.insert(0, extractor.header_names[1], names)
+    df.insert(0, extractor.header_names[0], codes)
+    return df
+
+
+def legacy_registrations(extractor, df):
+    # EVDataExtractor.clean_data before vectorisation, minus the sheet read
+    df = df.copy()
+    df.rename(mapper={df.columns[0]: extractor.header_names[0], df.columns[1]: extractor.header_names[1]},
+              inplace=True, axis=1)
+    df_pivoted = df.melt(id_vars=extractor.header_names, var_name='Date', value_name=extractor.value_name)
+    df_pivoted['LA/RegionName'] = df_pivoted['LA/RegionName'].apply(lambda x: x.strip())
+    df_pivoted['LA/RegionName'] = df_pivoted['LA/RegionName'].apply(lambda x: x.lower())
+    df_pivoted['LA/RegionName'] = df_pivoted['LA/RegionName'].apply(lambda x: x.title())
+    df_pivoted[extractor.value_name] = df_pivoted[extractor.value_name].replace('c', 0.0)
+    df_pivoted[extractor.value_name] = df_pivoted[extractor.value_name].apply(lambda x: int(x))
+    return df_pivoted
+
+
+def legacy_charging(extractor, df):
+    # EVCPDataExtractor.clean_data before vectorisation, minus the sheet read
+    unpivoted_df = df.melt(id_vars=extractor.header_names)
+    unpivoted_df['Date'] = unpivoted_df['variable'].apply(lambda x: x[-6:])
+    unpivoted_df['variable'] = unpivoted_df['variable'].apply(lambda x: x[:-6])
+    frames = []
+    for value_name in [extractor.value_name, extractor.value_name_average]:
+        frame = unpivoted_df.loc[unpivoted_df['variable'] == value_name].drop('variable', axis=1)
+        frame = frame.rename(mapper={'value': value_name}, axis=1)
+        frame[extractor.header_names[1]] = frame[extractor.header_names[1]].apply(lambda x: x.strip())
+        frame[extractor.header_names[1]] = frame[extractor.header_names[1]].apply(lambda x: x.lower())
+        frame[extractor.header_names[1]] = frame[extractor.header_names[1]].apply(lambda x: x.title())
+        frame[value_name] = frame[value_name].replace('-', 0).replace(np.nan, 0)
+        frame[value_name] = frame[value_name].apply(lambda x: int(x))
+        frames.append(frame)
+    return tuple(frames)
+
+
+def best_time(function, repeats):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = function()
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+def assert_same(legacy, vectorised):
+    for expected, actual in zip(legacy, vectorised):
+        pd.testing.assert_frame_equal(expected.reset_index(drop=True), actual.reset_index(drop=True))
+
+
+def main(regions=435, repeats=5):
+    rng = np.random.default_rng(0)
+    print(f'{"dataset":<24}{"periods":>8}{"rows":>10}{"legacy ms":>12}{"vectorised ms":>15}{"speedup":>9}')
+
+    for periods in [10, 40, 80, 160, 320]:
+        extractor = EVDataExtractor('', '', 'VEH0132a_All', 'ULEVRegistrations')
+        sheet = registrations_sheet(regions, periods, rng)
+        legacy_time, legacy = best_time(lambda: legacy_registrations(extractor, sheet), repeats)
+        vectorised_time, vectorised = best_time(lambda: extractor.clean_frame(sheet.copy()), repeats)
+        assert_same([legacy], [vectorised])
+        print(f'{"registrations":<24}{periods:>8}{len(vectorised):>10}{legacy_time * 1000:>12.1f}'
+              f'{vectorised_time * 1000:>15.1f}{legacy_time / vectorised_time:>8.1f}x')
+
+    for periods in [10, 40, 80, 160]:
+        extractor = EVCPDataExtractor('', '', 'EVCD_01a', 'TotalDevices')
+        sheet = charging_sheet(extractor, month_labels(periods), regions, rng)
+        legacy_time, legacy = best_time(lambda: legacy_charging(extractor, sheet), repeats)
+        vectorised_time, vectorised = best_time(lambda: extractor.clean_frame(sheet.copy()), repeats)
+        assert_same(legacy, vectorised)
+        print(f'{"charging devices":<24}{periods:>8}{len(vectorised[0]) * 2:>10}{legacy_time * 1000:>12.1f}'
+              f'{vectorised_time * 1000:>15.1f}{legacy_time / vectorised_time:>8.1f}x')
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:3]])
@@ -0,0 +1,55 @@
+'''
+Compares the memory held by the dashboard's data before and after the compact data store: the seven extractor
+csvs read into DataFrames as App.py originally held them (object region, code and date columns on every row and
+int64 values), against the EVDataStore built by load_data (one shared region table and a (region x period) cube
+per metric in the narrowest integer type). Retained memory is measured the same way for both with tracemalloc.
+
+Run from the repository root, with an optional json file of create_app config overrides (data directories etc.):
+    python benchmarks/bench_memory.py [config.json]
+'''
+import json
+import os
+import sys
+import tracemalloc
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from App import default_config, load_data, metric_sources
+
+
+def retained_bytes(load):
+    '''Returns what load() returns and the bytes it still holds once it has returned.'''
+    tracemalloc.start()
+    result = load()
+    current_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, current_bytes
+
+
+def main(config_path=None):
+    config = dict(default_config)
+    if config_path:
+        with open(config_path) as file:
+            config.update(json.load(file))
+
+    frames, frames_bytes = retained_bytes(lambda: {
+        metric_name: pd.read_csv(os.path.join(config[directory], file_name))
+        for metric_name, (directory, file_name, _, _) in metric_sources.items()})
+    data_store, store_bytes = retained_bytes(lambda: load_data(config))
+    store_usage = data_store.memory_usage()
+
+    print(f'{"metric":<20}{"rows":>8}{"DataFrame KiB":>15}{"store KiB":>11}{"store dtype":>13}')
+    for metric_name, frame in frames.items():
+        metric = data_store.metrics[metric_name]
+        dtype = getattr(metric, 'values', None)
+        print(f'{metric_name:<20}{len(frame):>8}{frame.memory_usage(deep=True).sum() / 1024:>15.0f}'
+              f'{store_usage.get(metric_name, 0) / 1024:>11.0f}{dtype.dtype.name if dtype is not None else "-":>13}')
+    print(f'{"shared regions":<20}{"":>8}{"":>15}{store_usage.get("regions", 0) / 1024:>11.0f}')
+    print(f'Retained: DataFrames {frames_bytes / 1024 ** 2:.2f} MiB, data store {store_bytes / 1024 ** 2:.2f} MiB '
+          f'({frames_bytes / max(store_bytes, 1):.1f}x smaller)')
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:2])
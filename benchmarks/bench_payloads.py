@@ -0,0 +1,88 @@
+'''
+Reports the bytes sent to the browser for each dashboard interaction: every map option at its latest period, the
+projected maps, every line chart store including the derived metrics and both stamps. Each response is measured as sent uncompressed and with gzip and brotli when the
+app compresses responses.
+
+Run from the repository root, with an optional json file of create_app config overrides (data directories etc.):
+    python benchmarks/bench_payloads.py [config.json]
+'''
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from App import chart_definitions, create_app, default_config, load_data, map_definitions, projection_map_definitions
+
+stamp_outputs = ['total-change-container', 'percent-change-container', 'total-change-container-information',
+                 'percent-change-container-information', 'total-stamp-title', 'percent-stamp-title']
+
+
+def callback_request(outputs, inputs):
+    '''Builds the body Dash's renderer posts to /_dash-update-component.'''
+    if len(outputs) == 1:
+        output = f'{outputs[0][0]}.{outputs[0][1]}'
+        output_spec = {'id': outputs[0][0], 'property': outputs[0][1]}
+    else:
+        output = '..' + '...'.join(f'{component}.{prop}' for component, prop in outputs) + '..'
+        output_spec = [{'id': component, 'property': prop} for component, prop in outputs]
+    return {'output': output, 'outputs': output_spec, 'changedPropIds': [],
+            'inputs': [{'id': component, 'property': prop, 'value': value} for component, prop, value in inputs]}
+
+
+def interactions(data_store):
+    # Derived metrics have no data store entry of their own, so dates come from the timeline each map option uses
+    for map_option, (_, _, timeline_name, _) in map_definitions.items():
+        latest = data_store.timelines[timeline_name].latest
+        yield f'map {map_option}', callback_request(
+            [('map', 'figure'), ('map-dropdown-ev', 'style'), ('map-dropdown-evcp', 'style')],
+            [('map-dropdown-ev', 'value', latest if timeline_name == 'ev' else None),
+             ('map-dropdown-evcp', 'value', latest if timeline_name == 'evcp' else None),
+             ('map-chart-select-dropdown', 'value', map_option)])
+
+    for map_option in projection_map_definitions:
+        yield f'map {map_option}', callback_request(
+            [('map', 'figure'), ('map-dropdown-ev', 'style'), ('map-dropdown-evcp', 'style')],
+            [('map-dropdown-ev', 'value', None), ('map-dropdown-evcp', 'value', None),
+             ('map-chart-select-dropdown', 'value', map_option)])
+
+    for selection, (metric_name, _) in chart_definitions.items():
+        prefix = 'ev' if metric_name.endswith('Registrations') else 'evcp'
+        yield f'chart store {selection}', callback_request(
+            [(f'{prefix}-chart-store', 'data')], [(f'{prefix}-chart-selection-dropdown', 'value', selection)])
+
+    for prefix, selection, last in (('ev', 'ULEV', len(data_store.timelines['ev']) - 1),
+                                    ('evcp', 'total', len(data_store.timelines['evcp']) - 1)):
+        yield f'stamps {prefix}', callback_request(
+            [(f'{prefix}-{output}', 'children') for output in stamp_outputs],
+            [('location-dropdown', 'value', ['Great Britain']), (f'{prefix}-date-slider', 'value', [0, last]),
+             (f'{prefix}-chart-selection-dropdown', 'value', selection)])
+
+
+def main(config_path=None):
+    config = {}
+    if config_path:
+        with open(config_path) as file:
+            config = json.load(file)
+    config.update({'callback_cache_directory': None, 'map_data_loading': 'eager', 'report_startup_time': False})
+
+    app = create_app(config)
+    data_store = load_data({**default_config, **config})
+    client = app.server.test_client()
+    encodings = ['identity', 'gzip', 'br']
+    totals = dict.fromkeys(encodings, 0)
+
+    print(f'{"interaction":<30}' + ''.join(f'{encoding:>12}' for encoding in encodings))
+    for name, body in interactions(data_store):
+        sizes = []
+        for encoding in encodings:
+            response = client.post('/_dash-update-component', json=body, headers={'Accept-Encoding': encoding})
+            assert response.status_code == 200, response.data[:200]
+            sizes.append(len(response.get_data()))
+            totals[encoding] += sizes[-1]
+        print(f'{name:<30}' + ''.join(f'{size:>12}' for size in sizes))
+    print(f'{"total":<30}' + ''.join(f'{totals[encoding]:>12}' for encoding in encodings))
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:2])
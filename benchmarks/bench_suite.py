@@ -0,0 +1,363 @@
+'''
+Benchmarks the extractors and every server side App.py callback on synthetic DfT shaped data of a chosen scale, to
+see how the dashboard holds up with finer geographies (thousands of MSOA sized regions rather than ~400 districts)
+before committing to them.
+
+Fixtures are generated once per scale under the temp directory: the registrations and charging device workbooks as
+.ods files laid out like the DfT ones, and a GeoJSON with a boundary per region. The extractors write the app's csv
+and columnar inputs from those workbooks, so the app is benchmarked on the extractors' own output. Callbacks are
+called directly, not over HTTP, with the figure cache turned off so every call builds its result. The line chart
+filtering runs in the browser and is not covered.
+
+Each benchmark records the best wall time per call over the repeats and the peak memory allocated. Peak memory comes from one
+extra run under tracemalloc, so tracing does not skew the timings. Callbacks also record the size of their JSON
+response. Results are compared with benchmarks/baseline.json for the same scale: a time or peak memory over its
+baseline by more than time_tolerance or memory_tolerance, and by more than the noise floor, is flagged and the script exits 1. Timings depend on the
+machine, so save a baseline on the machine the comparisons run on.
+
+Run from the repository root:
+    python benchmarks/bench_suite.py [regions] [ev_periods] [evcp_periods] [repeats] [--save-baseline]
+'''
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from xml.sax.saxutils import escape
+import zipfile
+
+import numpy as np
+from plotly.io.json import to_json_plotly
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from App import chart_definitions, create_app, default_config, derived_metric_definitions, load_data, \
+    map_definitions, projection_map_definitions, stamp_definitions
+from EVDataExtractorChargingDevices import EVCPDataExtractor
+from EVDataExtractorRegistrations import EVDataExtractor
+from EVDerivedMetrics import TimeAlignment, derive_metrics
+from EVGeoData import build_boundary_levels
+from EVProjection import ProjectionEngine
+from EVWorkbook import open_workbook
+from bench_clean_data import month_labels, quarter_labels
+
+baseline_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+# Slowest time and largest peak memory accepted relative to the baseline, ignoring differences below the floors,
+# which are within run to run noise
+time_tolerance = 1.5
+memory_tolerance = 1.1
+time_floor = 0.001
+memory_floor = 64 * 1024
+
+# Sheets extracted for the app: value name and output file(s)
+registration_sheets = {'VEH0132a_All': ('ULEVRegistrations', 'ev_registrations_ulev.csv'),
+                       'VEH0132b_BEV': ('BEVRegistrations', 'ev_registrations_bev.csv'),
+                       'VEH0132c_PHEV': ('PHEVRegistrations', 'ev_registrations_phev.csv')}
+charging_sheets = {'EVCD_01a': ('TotalDevices', 'charge_points_devices_total.csv', 'charge_points_per_100k_total.csv'),
+                   'EVCD_01b': ('RapidDevices', 'charge_points_devices_rapid.csv', 'charge_points_per_100k_rapid.csv')}
+
+
+def synthetic_regions(regions):
+    '''Returns codes and names of the UK and GB totals followed by regions MSOA style areas.'''
+    codes = ['K02000001', 'K03000001'] + [f'E02{i:06d}' for i in range(regions)]
+    names = ['UNITED KINGDOM', 'Great Britain'] + [f'AREA {i} AND DISTRICT' for i in range(regions)]
+    return codes, names
+
+
+def sheet_grid(header, rows, skip_rows, skip_footer):
+    # Title rows above the header and notes below the data, as skipped by the extractors
+    grid = [[f'Title {i}'] for i in range(skip_rows)]
+    grid += [header] + rows
+    grid += [[f'Note {i}'] for i in range(skip_footer)]
+    return grid
+
+
+def ods_cell(value):
+    if value is None:
+        return '<table:table-cell/>'
+    if isinstance(value, str):
+        return f'<table:table-cell office:value-type="string"><text:p>{escape(value)}</text:p></table:table-cell>'
+    return f'<table:table-cell office:value-type="float" office:value="{value}"><text:p>{value}</text:p></table:table-cell>'
+
+
+def write_ods(path, sheets):
+    '''
+    Writes {sheet name: rows of cell values} as a minimal .ods workbook. Far quicker than pandas' odf writer, which
+    takes minutes for MSOA sized sheets.
+    '''
+    write_ods_rows(path, {sheet_name: ['<table:table-row>' + ''.join(map(ods_cell, row)) + '</table:table-row>'
+                                       for row in rows]
+                          for sheet_name, rows in sheets.items()})
+
+
+def write_ods_rows(path, sheets):
+    '''Writes {sheet name: table-row XML strings} as a minimal .ods workbook.'''
+    namespaces = ' '.join(f'xmlns:{prefix}="urn:oasis:names:tc:opendocument:xmlns:{name}:1.0"'
+                          for prefix, name in (('office', 'office'), ('table', 'table'), ('text', 'text')))
+    content = [f'<?xml version="1.0" encoding="UTF-8"?><office:document-content {namespaces} office:version="1.2">'
+               '<office:body><office:spreadsheet>']
+    for sheet_name, rows in sheets.items():
+        content.append(f'<table:table table:name="{escape(sheet_name)}">')
+        content.extend(rows)
+        content.append('</table:table>')
+    content.append('</office:spreadsheet></office:body></office:document-content>')
+
+    manifest = ('<?xml version="1.0" encoding="UTF-8"?><manifest:manifest '
+                'xmlns:manifest="urn:oasis:names:tc:opendocument:xmlns:manifest:1.0" manifest:version="1.2">'
+                '<manifest:file-entry manifest:full-path="/" '
+                'manifest:media-type="application/vnd.oasis.opendocument.spreadsheet"/>'
+                '<manifest:file-entry manifest:full-path="content.xml" manifest:media-type="text/xml"/>'
+                '</manifest:manifest>')
+    with zipfile.ZipFile(path, 'w') as archive:
+        # The mimetype must come first and uncompressed
+        archive.writestr('mimetype', 'application/vnd.oasis.opendocument.spreadsheet', zipfile.ZIP_STORED)
+        archive.writestr('content.xml', ''.join(content), zipfile.ZIP_DEFLATED)
+        archive.writestr('META-INF/manifest.xml', manifest, zipfile.ZIP_DEFLATED)
+
+
+def registrations_workbook(path, regions, periods, rng):
+    codes, names = synthetic_regions(regions)
+    header = ['ONS LA Code (April-2019)', 'Region/Local Authority (Apr-2019)'] + quarter_labels(periods)
+    sheets = {}
+    for sheet_name in registration_sheets:
+        values = rng.integers(0, 50000, size=(len(codes), periods)).astype(object)
+        values[rng.random(values.shape) < 0.05] = 'c'
+        rows = [[code, name] + row for code, name, row in zip(codes, names, values.tolist())]
+        sheets[sheet_name] = sheet_grid(header, rows, EVDataExtractor.skip_rows, EVDataExtractor.skip_footer)
+    write_ods(path, sheets)
+
+
+def charging_workbook(path, regions, periods, rng):
+    codes, names = synthetic_regions(regions)
+    header = ['LA / Region Code', 'Local Authority / Region Name']
+    for date in month_labels(periods):
+        header += [f'Total {date}', f'Per 100,000 population {date}']
+    sheets = {}
+    for sheet_name in charging_sheets:
+        values = np.empty((len(codes), 2 * periods), dtype=object)
+        values[:, 0::2] = rng.integers(0, 5000, size=(len(codes), periods))
+        values[:, 1::2] = rng.integers(0, 900, size=(len(codes), periods))
+        values[rng.random(values.shape) < 0.05] = '-'
+        rows = [[code, name] + row for code, name, row in zip(codes, names, values.tolist())]
+        sheets[sheet_name] = sheet_grid(header, rows, EVCPDataExtractor.skip_rows, EVCPDataExtractor.skip_footer)
+    write_ods(path, sheets)
+
+
+def boundaries_geojson(path, regions, vertices=24):
+    '''Writes a ring shaped boundary per region on a grid over Great Britain.'''
+    codes, names = synthetic_regions(regions)
+    side = int(np.ceil(np.sqrt(regions)))
+    radius = 0.45 * min(8 / side, 9 / side)
+    angles = np.linspace(0, 2 * np.pi, vertices, endpoint=False)
+    features = []
+    for i, (code, name) in enumerate(zip(codes[2:], names[2:])):
+        lon, lat = -6 + 8 * (i % side + 0.5) / side, 50 + 9 * (i // side + 0.5) / side
+        # Alternating radii give the simplification something to remove
+        ring = radius * np.where(np.arange(vertices) % 2, 1, 0.9)
+        coordinates = np.column_stack([lon + ring * np.cos(angles), lat + ring * np.sin(angles)]).round(6).tolist()
+        features.append({'type': 'Feature', 'properties': {'LAD20CD': code, 'LAD20NM': name.title()},
+                         'geometry': {'type': 'Polygon', 'coordinates': [coordinates + coordinates[:1]]}})
+    with open(path, 'w') as file:
+        json.dump({'type': 'FeatureCollection', 'features': features}, file)
+
+
+def fixtures(regions, ev_periods, evcp_periods):
+    '''Returns the fixture directory for a scale, generating it on first use.'''
+    directory = os.path.join(tempfile.gettempdir(), 'ev_dashboard_bench', f'{regions}x{ev_periods}x{evcp_periods}')
+    if not os.path.exists(os.path.join(directory, 'complete')):
+        os.makedirs(os.path.join(directory, 'data'), exist_ok=True)
+        print(f'Generating fixtures in {directory}')
+        rng = np.random.default_rng(0)
+        registrations_workbook(os.path.join(directory, 'veh0132.ods'), regions, ev_periods, rng)
+        charging_workbook(os.path.join(directory, 'charging_devices.ods'), regions, evcp_periods, rng)
+        boundaries_geojson(os.path.join(directory, 'boundaries.geojson'), regions)
+        open(os.path.join(directory, 'complete'), 'w').close()
+    return directory
+
+
+def measure(function, repeats, min_sample_seconds=0.05):
+    '''
+    Returns the best seconds per call over repeats, the peak bytes allocated by one traced run and the result. Quick
+    functions are called in a loop until a sample takes min_sample_seconds, as timeit does, so sub millisecond
+    callbacks are not lost in timer noise.
+    '''
+    start = time.perf_counter()
+    result = function()
+    calls = max(1, int(min_sample_seconds / max(time.perf_counter() - start, 1e-6)))
+
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for _ in range(calls):
+            function()
+        timings.append((time.perf_counter() - start) / calls)
+    tracemalloc.start()
+    function()
+    peak_bytes = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return min(timings), peak_bytes, result
+
+
+def streamed_clean_data(extractor, *args):
+    # Reads the sheet the way EVExtractionRunner does
+    with open_workbook(extractor.source_url, streaming=True, sheet_names=[extractor.sheet_name]) as workbook:
+        return extractor.clean_data(*args, workbook=workbook)
+
+
+def bench_extractors(directory, evcp_periods, repeats):
+    '''Times clean_data for every sheet and writes the outputs to the fixture data directory.'''
+    results = {}
+    data_directory = os.path.join(directory, 'data')
+    source = os.path.join(directory, 'veh0132.ods')
+    for sheet_name, (value_name, file_name) in registration_sheets.items():
+        extractor = EVDataExtractor(source, data_directory, sheet_name, value_name)
+        seconds, peak_bytes, dataframe = measure(lambda: streamed_clean_data(extractor), repeats)
+        extractor.write_date(dataframe, file_name)
+        results[f'EVDataExtractor.clean_data {sheet_name}'] = {'seconds': seconds, 'peak_bytes': peak_bytes}
+
+    source = os.path.join(directory, 'charging_devices.ods')
+    for sheet_name, (value_name, file_name, file_name_average) in charging_sheets.items():
+        extractor = EVCPDataExtractor(source, data_directory, sheet_name, value_name)
+        seconds, peak_bytes, (dataframe, dataframe_average) = measure(
+            lambda: streamed_clean_data(extractor, True), repeats)
+        extractor.write_date(dataframe, dataframe_average, file_name, file_name_average)
+        results[f'EVCPDataExtractor.clean_data {sheet_name}'] = {'seconds': seconds, 'peak_bytes': peak_bytes}
+    return results
+
+
+def callback_functions(app):
+    # The functions registered with app.callback, under Dash's request handling wrapper
+    return {entry['callback'].__wrapped__.__name__: entry['callback'].__wrapped__
+            for entry in app.callback_map.values() if 'callback' in entry}
+
+
+def callback_cases(regions, ev_periods, evcp_periods):
+    '''Yields (benchmark name, callback name, arguments) covering every callback with realistic inputs.'''
+    rng = np.random.default_rng(1)
+    _, names = synthetic_regions(regions)
+    region_names = [name.title() for name in names[2:]]
+    ev_dates, evcp_dates = quarter_labels(ev_periods), month_labels(evcp_periods)
+
+    for selection, (metric_name, _) in chart_definitions.items():
+        prefix = 'ev' if metric_name.endswith('Registrations') else 'evcp'
+        yield f'update_{prefix}_chart_store {selection}', f'update_{prefix}_chart_store', (selection,)
+
+    for map_option, (_, _, timeline_name, _) in map_definitions.items():
+        dates = ev_dates if timeline_name == 'ev' else evcp_dates
+        for label, date in (('latest', dates[0]), ('earliest', dates[-1])):
+            arguments = (date, evcp_dates[0], map_option) if timeline_name == 'ev' else (ev_dates[0], date, map_option)
+            yield f'update_map {map_option} {label}', 'update_map', arguments
+
+    for map_option in projection_map_definitions:
+        yield f'update_map {map_option}', 'update_map', (ev_dates[0], evcp_dates[0], map_option)
+
+    location_lists = {'GB': ['Great Britain'],
+                      '10 regions': list(rng.choice(region_names, min(10, regions), replace=False)),
+                      '100 regions': list(rng.choice(region_names, min(100, regions), replace=False))}
+    for prefix, periods in (('ev', ev_periods), ('evcp', evcp_periods)):
+        selection = next(selection for selection, (metric_name, _) in stamp_definitions.items()
+                         if metric_name.endswith('Registrations') == (prefix == 'ev'))
+        for locations_label, locations in location_lists.items():
+            for range_label, time_period in (('full range', [0, periods - 1]),
+                                             ('last 4', [max(periods - 5, 0), periods - 1])):
+                yield (f'update_stamps_{prefix} {locations_label} {range_label}', f'update_stamps_{prefix}',
+                       (locations, time_period, selection))
+
+
+def bench_app(directory, regions, ev_periods, evcp_periods, repeats):
+    data_directory = os.path.join(directory, 'data')
+    config = {'evcp_data_directory': data_directory, 'ev_registrations_directory': data_directory,
+              'geo_data_uk_districts': os.path.join(directory, 'boundaries.geojson'),
+              'geo_data_cache_directory': os.path.join(directory, 'boundaries'),
+              'callback_cache_directory': None, 'map_cache_max_bytes': 0, 'map_data_loading': 'eager',
+              'data_reload_interval': None, 'report_startup_time': False}
+
+    def simplify_boundaries():
+        with tempfile.TemporaryDirectory() as cache_directory:
+            build_boundary_levels(config['geo_data_uk_districts'], cache_directory)
+
+    # Boundaries are simplified once per source file, so create_app is timed with the simplified levels on disk
+    seconds, peak_bytes, _ = measure(simplify_boundaries, 1)
+    results = {'build_boundary_levels': {'seconds': seconds, 'peak_bytes': peak_bytes}}
+    build_boundary_levels(config['geo_data_uk_districts'], config['geo_data_cache_directory'])
+
+    seconds, peak_bytes, app = measure(lambda: create_app(config), repeats)
+    results['create_app'] = {'seconds': seconds, 'peak_bytes': peak_bytes}
+
+    # Projections are cached per data version, so fitting them is timed on its own with a fresh engine per call
+    data_store = load_data({**default_config, **config})
+
+    def project_metrics():
+        engine = ProjectionEngine(data_store, default_config['projection_fit_periods'],
+                                  default_config['projection_horizon'])
+        for metric_name in data_store.metrics:
+            engine.projection(metric_name)
+
+    seconds, peak_bytes, _ = measure(project_metrics, repeats)
+    results['project every metric'] = {'seconds': seconds, 'peak_bytes': peak_bytes}
+
+    def derive():
+        alignment = TimeAlignment(data_store.timelines, default_config['derived_metric_max_lag_months'])
+        return derive_metrics(data_store, derived_metric_definitions, alignment)
+
+    seconds, peak_bytes, _ = measure(derive, repeats)
+    results['derive every metric'] = {'seconds': seconds, 'peak_bytes': peak_bytes}
+
+    callbacks = callback_functions(app)
+    for name, callback_name, arguments in callback_cases(regions, ev_periods, evcp_periods):
+        seconds, peak_bytes, result = measure(lambda: callbacks[callback_name](*arguments), repeats)
+        results[name] = {'seconds': seconds, 'peak_bytes': peak_bytes, 'payload_bytes': len(to_json_plotly(result))}
+    return results
+
+
+def compare(results, baseline):
+    '''Prints the results against the baseline and returns the names of the regressed benchmarks.'''
+    regressions = []
+    print(f'{"benchmark":<48}{"ms":>10}{"peak KiB":>11}{"payload KiB":>13}{"vs baseline":>28}')
+    for name, result in results.items():
+        payload = f'{result["payload_bytes"] / 1024:.1f}' if 'payload_bytes' in result else '-'
+        versus = ''
+        if name in baseline:
+            time_ratio = result['seconds'] / baseline[name]['seconds']
+            memory_ratio = result['peak_bytes'] / max(baseline[name]['peak_bytes'], 1)
+            versus = f'{time_ratio:.2f}x time {memory_ratio:.2f}x mem'
+            slower = time_ratio > time_tolerance and result['seconds'] - baseline[name]['seconds'] > time_floor
+            larger = memory_ratio > memory_tolerance and \
+                     result['peak_bytes'] - baseline[name]['peak_bytes'] > memory_floor
+            if slower or larger:
+                versus += ' !'
+                regressions.append(name)
+        print(f'{name:<48}{result["seconds"] * 1000:>10.2f}{result["peak_bytes"] / 1024:>11.0f}{payload:>13}'
+              f'{versus:>28}')
+    return regressions
+
+
+def main(regions=400, ev_periods=40, evcp_periods=10, repeats=5, save_baseline=False):
+    scale = f'{regions}x{ev_periods}x{evcp_periods}'
+    directory = fixtures(regions, ev_periods, evcp_periods)
+    results = bench_extractors(directory, evcp_periods, max(repeats // 5, 1))
+    results.update(bench_app(directory, regions, ev_periods, evcp_periods, repeats))
+
+    baselines = {}
+    if os.path.exists(baseline_path):
+        with open(baseline_path) as file:
+            baselines = json.load(file)
+
+    print(f'Scale {scale} (regions x registration quarters x charging device months)')
+    regressions = compare(results, baselines.get(scale, {}))
+
+    if save_baseline:
+        baselines[scale] = results
+        with open(baseline_path, 'w') as file:
+            json.dump(baselines, file, indent=1, sort_keys=True)
+        print(f'Baseline for {scale} saved to {baseline_path}')
+    elif regressions:
+        print(f'{len(regressions)} benchmarks over their baseline by more than the tolerance')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    arguments = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    sys.exit(main(*[int(arg) for arg in arguments[:4]], save_baseline='--save-baseline' in sys.argv))
@@ -0,0 +1,108 @@
+'''
+Checks that StreamingWorkbook.parse returns exactly what pd.read_excel does, on fixture workbooks written to a temp
+directory. The fixtures cover what the DfT workbooks contain and the streaming reader handles itself: repeated rows
+and cells, including the padding to the edge of the sheet, run length encoded spaces (text:s), merged and covered
+cells, blank rows inside the data, mixed cell types, empty sheets, title and footnote rows removed with skip_rows
+and skip_footer, and headers replaced by names. Exits 1 on the first sheet that differs.
+
+Run from the repository root:
+    python benchmarks/check_workbook.py
+'''
+import os
+import sys
+import tempfile
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from EVWorkbook import open_workbook, read_sheet
+from bench_suite import write_ods, write_ods_rows
+
+# (skip rows, skip footer) each sheet is read with
+skip_cases = [(0, 0), (2, 0), (2, 3), (3, 1)]
+
+
+def cell(value, repeat=1, span=1):
+    attributes = f' table:number-columns-repeated="{repeat}"' if repeat > 1 else ''
+    attributes += f' table:number-columns-spanned="{span}"' if span > 1 else ''
+    if value is None:
+        return f'<table:table-cell{attributes}/>'
+    if isinstance(value, str):
+        return f'<table:table-cell{attributes} office:value-type="string"><text:p>{value}</text:p></table:table-cell>'
+    return (f'<table:table-cell{attributes} office:value-type="float" office:value="{value}"><text:p>{value}'
+            f'</text:p></table:table-cell>')
+
+
+def row(*cells, repeat=1):
+    attribute = f' table:number-rows-repeated="{repeat}"' if repeat > 1 else ''
+    return f'<table:table-row{attribute}>' + ''.join(cells) + '</table:table-row>'
+
+
+def edge_case_rows():
+    '''A DfT shaped sheet: title rows, a header, data with every edge case, footnotes and padding.'''
+    return [
+        row(cell('Table EVCD_01: Electric vehicle charging devices'), cell(None, repeat=1024)),
+        row(cell(None, repeat=1024), repeat=1),
+        row(cell('Code'), cell('Name'), cell('Total<text:s text:c="3"/>Jan-22'), cell('Per<text:s/>100k'),
+            cell('Flag'), cell(None, repeat=1019)),
+        row(cell('E06000001'), cell('Hartlepool'), cell(12), cell(13.5), cell('c'), cell(None, repeat=1019)),
+        # The same value repeated across cells
+        row(cell('E06000002'), cell('Middlesbrough'), cell(7, repeat=2), cell('-'), cell(None, repeat=1019)),
+        # A merged name spanning two columns, the second covered
+        row(cell('E06000003'), cell('Redcar and Cleveland', span=2), '<table:covered-table-cell/>', cell(4.25),
+            cell('x')),
+        # Blank rows inside the data are kept as rows of NaN
+        row(cell(None, repeat=1024), repeat=2),
+        # A row repeated with content
+        row(cell('E06000004'), cell('Stockton-on-Tees'), cell(0), cell(0), cell(None), repeat=3),
+        row(cell('E06000005'), cell('Darlington <text:span>Borough</text:span>'), cell(None), cell(2),
+            cell('#N/A'), '<table:table-cell office:value-type="percentage" office:value="0.25"><text:p>25%'
+            '</text:p></table:table-cell>'),
+        row(cell('E06000006'), cell('Halton'), cell(3), cell(1), '<table:table-cell office:value-type="boolean" '
+            'office:boolean-value="true"><text:p>TRUE</text:p></table:table-cell>'),
+        row(cell(None, repeat=1024)),
+        row(cell('Source: DfT'), cell(None, repeat=1023)),
+        row(cell('Notes:  see<text:s text:c="2"/>the cover sheet')),
+        # Padding to the edge of the sheet
+        row(cell(None, repeat=1024), repeat=1048560),
+    ]
+
+
+def check(path, sheet_names, names=None):
+    for skip_rows, skip_footer in skip_cases:
+        with open_workbook(path, streaming=True, sheet_names=sheet_names) as workbook:
+            for sheet_name in sheet_names:
+                expected = pd.read_excel(path, sheet_name=sheet_name, skiprows=skip_rows, skipfooter=skip_footer,
+                                         names=names, engine='odf')
+                parsed = read_sheet(workbook, sheet_name, skip_rows, skip_footer, names)
+                pd.testing.assert_frame_equal(parsed, expected)
+                print(f'{os.path.basename(path)} {sheet_name} skip {skip_rows}/{skip_footer}: {expected.shape} '
+                      f'matches read_excel')
+
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        edge_cases = os.path.join(directory, 'edge_cases.ods')
+        write_ods_rows(edge_cases, {'Unwanted': edge_case_rows(), 'EVCD_01': edge_case_rows(),
+                                    'Empty': [row(cell(None, repeat=1024), repeat=1048576)]})
+        plain = os.path.join(directory, 'plain.ods')
+        write_ods(plain, {'VEH0132a': [['Title', None], [None, None], ['Code', 'Name', '2021 Q3'],
+                                       ['E06000001', 'Hartlepool', 120], ['E06000002', 'Middlesbrough', 'c'],
+                                       ['E06000003', 'Redcar', 9], ['Notes', None], ['Source', None],
+                                       ['Footnote', None]]})
+        try:
+            # Sheets are read on their own and together, the unwanted sheet before them is skipped
+            check(edge_cases, ['EVCD_01'])
+            check(edge_cases, ['EVCD_01', 'Unwanted', 'Empty'])
+            # With the header replaced by names
+            check(edge_cases, ['EVCD_01'], names=['code', 'name', 'total', 'per_100k', 'flag', 'extra'])
+            check(plain, ['VEH0132a'])
+        except AssertionError as error:
+            print(error)
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
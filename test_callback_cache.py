@@ -0,0 +1,112 @@
+import os
+import time
+
+import pytest
+
+from EVCallbackCache import CallbackCache
+
+
+def make_cache(directory, **kwargs):
+    return CallbackCache(str(directory), 'v1', **{'evict_interval': 3600, **kwargs})
+
+
+def age(path, seconds):
+    past = time.time() - seconds
+    os.utime(path, (past, past))
+
+
+def test_stale_lock_is_taken_over(tmp_path):
+    cache = make_cache(tmp_path / 'cache', lock_timeout=5)
+    key = cache.key('callback', (1,))
+    lock_path = cache._path(key) + '.lock'
+    # Left behind by a worker that died mid computation
+    with open(lock_path, 'w') as file:
+        file.write('dead worker')
+    age(lock_path, 60)
+
+    assert cache.get_or_compute(key, lambda: 'result') == 'result'
+    assert cache.misses == 1
+    assert not os.path.exists(lock_path)
+    assert cache.get(key) == (True, 'result')
+
+
+def test_live_lock_is_waited_on_and_left_to_its_owner(tmp_path):
+    cache = make_cache(tmp_path / 'cache', lock_timeout=0.2)
+    key = cache.key('callback', (1,))
+    lock_path = cache._path(key) + '.lock'
+    with open(lock_path, 'w') as file:
+        file.write('other worker')
+
+    start = time.monotonic()
+    assert cache.get_or_compute(key, lambda: 'result') == 'result'
+    assert time.monotonic() - start >= 0.2
+    with open(lock_path) as file:
+        assert file.read() == 'other worker'
+
+
+def test_lock_taken_over_by_another_worker_is_not_released(tmp_path):
+    cache = make_cache(tmp_path / 'cache')
+    lock_path = str(tmp_path / 'cache' / 'entry.lock')
+    assert cache._acquire(lock_path, 'first')
+    assert not cache._acquire(lock_path, 'second')
+    with open(lock_path, 'w') as file:
+        file.write('second')
+
+    cache._release(lock_path, 'first')
+    assert os.path.exists(lock_path)
+    cache._release(lock_path, 'second')
+    assert not os.path.exists(lock_path)
+
+
+@pytest.mark.skipif(not hasattr(os, 'getuid'), reason='permissions are only checked on POSIX')
+def test_directory_is_created_private(tmp_path):
+    directory = tmp_path / 'cache'
+    make_cache(directory)
+    assert os.stat(directory).st_mode & 0o777 == 0o700
+
+
+@pytest.mark.skipif(not hasattr(os, 'getuid'), reason='permissions are only checked on POSIX')
+@pytest.mark.parametrize('mode', [0o777, 0o770, 0o722])
+def test_directory_writable_by_others_is_refused(tmp_path, mode):
+    directory = tmp_path / 'cache'
+    directory.mkdir()
+    os.chmod(directory, mode)
+    with pytest.raises(PermissionError):
+        make_cache(directory)
+
+
+def test_inputs_and_data_version_key_entries(tmp_path):
+    versions = ['v1']
+    cache = CallbackCache(str(tmp_path / 'cache'), lambda: versions[0])
+    key = cache.key('callback', ('Map1', 'Jan-22'))
+    assert key == cache.key('callback', ('Map1', 'Jan-22'))
+    assert key != cache.key('callback', ('Map1', 'Oct-21'))
+    assert key != cache.key('other_callback', ('Map1', 'Jan-22'))
+    versions[0] = 'v2'
+    assert key != cache.key('callback', ('Map1', 'Jan-22'))
+
+
+def test_eviction_removes_least_recently_used_first(tmp_path):
+    cache = make_cache(tmp_path / 'cache')
+    for seconds, name in [(300, 'a'), (200, 'b'), (100, 'c')]:
+        cache.put(name, b'x' * 1000)
+        age(cache._path(name), seconds)
+    # Reading a makes it the most recently used
+    assert cache.get('a') == (True, b'x' * 1000)
+
+    cache.max_bytes = 2500
+    cache.evict()
+    assert [cache.get(name)[0] for name in 'abc'] == [True, False, True]
+    assert cache._bytes <= cache.max_bytes * 0.9
+
+
+def test_expired_entries_are_not_served_and_are_evicted(tmp_path):
+    cache = make_cache(tmp_path / 'cache', ttl=60)
+    cache.put('old', 'value')
+    cache.put('new', 'value')
+    age(cache._path('old'), 120)
+
+    assert cache.get('old') == (False, None)
+    cache.evict()
+    assert not os.path.exists(cache._path('old'))
+    assert cache.get('new') == (True, 'value')
@@ -0,0 +1,55 @@
+import pandas as pd
+
+from EVColumnarStore import ColumnarTable
+from EVSqliteStore import SqlDataStore, metric_revisions, write_table
+
+
+def registrations(leeds_value):
+    frame = pd.DataFrame({'LA/RegionCode': ['E08000035', 'E08000035', 'E06000001', 'E06000001'],
+                          'LA/RegionName': ['Leeds', 'Leeds', 'Hartlepool', 'Hartlepool'],
+                          'Date': ['2021 Q2', '2021 Q3', '2021 Q2', '2021 Q3'],
+                          'ULEVRegistrations': [100, leeds_value, 10, 12]})
+    return ColumnarTable.from_frame(frame, 'ULEVRegistrations')
+
+
+def devices():
+    frame = pd.DataFrame({'LA/RegionCode': ['E08000035'], 'LA/RegionName': ['Leeds'], 'Date': ['Jan-22'],
+                          'TotalDevices': [40]})
+    return ColumnarTable.from_frame(frame, 'TotalDevices')
+
+
+def open_store(database_path):
+    return SqlDataStore(database_path, {'ULEVRegistrations': ('ev_registrations_ulev', 'ULEVRegistrations', 'ev'),
+                                        'TotalDevices': ('charge_points_devices_total', 'TotalDevices', 'evcp')})
+
+
+def test_changed_value_changes_only_that_metrics_revision(tmp_path):
+    database_path = str(tmp_path / 'ev_dashboard.sqlite')
+    write_table(database_path, 'ev_registrations_ulev', registrations(150))
+    write_table(database_path, 'charge_points_devices_total', devices())
+    before = metric_revisions(database_path)
+    store = open_store(database_path)
+
+    write_table(database_path, 'ev_registrations_ulev', registrations(175))
+    after = metric_revisions(database_path)
+    assert after['ev_registrations_ulev'] != before['ev_registrations_ulev']
+    assert after['charge_points_devices_total'] == before['charge_points_devices_total']
+
+    revised = open_store(database_path)
+    assert revised.version != store.version
+    stats = revised.change_statistics('ULEVRegistrations', ['Leeds', 'Hartlepool'], 0, 1)
+    assert stats.change.tolist() == [75, 2]
+    assert stats.present.tolist() == [True, True]
+
+
+def test_period_frame_reads_one_period(tmp_path):
+    database_path = str(tmp_path / 'ev_dashboard.sqlite')
+    write_table(database_path, 'ev_registrations_ulev', registrations(150))
+    write_table(database_path, 'charge_points_devices_total', devices())
+    store = open_store(database_path)
+
+    frame = store.period_frame('ULEVRegistrations', '2021 Q3')
+    assert frame.to_dict('records') == [
+        {'LA/RegionCode': 'E08000035', 'LA/RegionName': 'Leeds', 'ULEVRegistrations': 150},
+        {'LA/RegionCode': 'E06000001', 'LA/RegionName': 'Hartlepool', 'ULEVRegistrations': 12}]
+    assert store.period_frame('ULEVRegistrations', None).empty
@@ -0,0 +1,56 @@
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+# The fixture workbooks are shared with benchmarks/check_workbook.py
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmarks'))
+
+from EVWorkbook import StreamingWorkbook, open_workbook, read_sheet
+from bench_suite import write_ods_rows
+from check_workbook import cell, edge_case_rows, row, skip_cases
+
+sheets = {'Unwanted': edge_case_rows(), 'EVCD_01': edge_case_rows(),
+          'Empty': [row(cell(None, repeat=1024), repeat=1048576)]}
+
+
+@pytest.fixture(scope='module')
+def workbook_path(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp('workbooks') / 'edge_cases.ods')
+    write_ods_rows(path, sheets)
+    return path
+
+
+@pytest.mark.parametrize('skip_rows, skip_footer', skip_cases)
+@pytest.mark.parametrize('sheet_name', ['EVCD_01', 'Empty'])
+def test_streaming_matches_read_excel(workbook_path, sheet_name, skip_rows, skip_footer):
+    with open_workbook(workbook_path, streaming=True, sheet_names=[sheet_name]) as workbook:
+        assert isinstance(workbook, StreamingWorkbook)
+        parsed = read_sheet(workbook, sheet_name, skip_rows, skip_footer)
+    expected = pd.read_excel(workbook_path, sheet_name=sheet_name, skiprows=skip_rows, skipfooter=skip_footer,
+                             engine='odf')
+    pd.testing.assert_frame_equal(parsed, expected)
+
+
+def test_streaming_matches_read_excel_with_names(workbook_path):
+    names = ['code', 'name', 'total', 'per_100k', 'flag', 'extra']
+    with open_workbook(workbook_path, streaming=True, sheet_names=['EVCD_01']) as workbook:
+        parsed = read_sheet(workbook, 'EVCD_01', 2, 3, names)
+    expected = pd.read_excel(workbook_path, sheet_name='EVCD_01', skiprows=2, skipfooter=3, names=names, engine='odf')
+    pd.testing.assert_frame_equal(parsed, expected)
+
+
+def test_edge_cases_are_parsed(workbook_path):
+    with open_workbook(workbook_path, streaming=True, sheet_names=['EVCD_01']) as workbook:
+        df = read_sheet(workbook, 'EVCD_01', 2, 3)
+    # Run length encoded spaces in the header, a covered cell after a merged name and a repeated row
+    assert list(df.columns[:4]) == ['Code', 'Name', 'Total   Jan-22', 'Per 100k']
+    assert df.loc[df['Code'] == 'E06000003', 'Name'].tolist() == ['Redcar and Cleveland']
+    assert (df['Code'] == 'E06000004').sum() == 3
+
+
+def test_missing_sheet_is_reported(workbook_path):
+    with open_workbook(workbook_path, streaming=True, sheet_names=['EVCD_01']) as workbook:
+        with pytest.raises(ValueError, match='sheet Missing not found'):
+            read_sheet(workbook, 'Missing', 0, 0)
@@ -0,0 +1,34 @@
+'''
+Production WSGI entry point. Run with gunicorn, preloading the app so the data is loaded once in the master process
+and shared copy-on-write by the forked workers:
+
+    gunicorn --preload --workers 4 --bind 0.0.0.0:8050 wsgi:server
+
+Configuration is read from the json file named by the EV_DASHBOARD_CONFIG environment variable, any key it leaves
+out is taken from App.default_config. Map data loading defaults to 'eager' here, so the boundaries are prepared in the
+master and shared too, and no warm-up thread is running when the workers fork.
+'''
+
+import gc
+import json
+import os
+
+from App import create_app
+
+
+def read_config():
+    path = os.environ.get('EV_DASHBOARD_CONFIG')
+    if not path:
+        return {}
+    with open(path) as file:
+        return json.load(file)
+
+
+config = read_config()
+config.setdefault('map_data_loading', 'eager')
+app = create_app(config)
+server = app.server
+
+# Everything loaded so far lives as long as the app. Freezing it keeps the garbage collector in the workers from
+# writing to, and so copying, the pages that hold it.
+gc.freeze()